@@ -0,0 +1,136 @@
+"""
+Analytics API
+Аналитика по всей организации (только для админов)
+
+Все ответы строятся из rollup-таблиц (app/core/analytics.py), поэтому
+стоимость запросов не зависит от размера таблицы задач. refreshed_at —
+время последнего обновления агрегатов.
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from ..core.analytics import daily_rollup, due_rollup, user_rollup, watermarks
+from ..core.database import get_db
+from ..core.rate_limit import rate_limit
+from ..core.security import get_current_active_admin
+from ..models.models import User
+
+router = APIRouter(
+    prefix="/api/admin/analytics",
+    tags=["Analytics"],
+    dependencies=[Depends(get_current_active_admin), Depends(rate_limit)],
+)
+
+
+def refreshed_at(db: Session) -> Optional[datetime]:
+    """Самое старое из времён обновления по шардам"""
+    return db.execute(select(func.min(watermarks.c.refreshed_at))).scalar()
+
+
+def _today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+@router.get("/tasks-per-user")
+async def tasks_per_user(
+    after_id: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    """Задачи по пользователям (постранично по id, без OFFSET)"""
+    rows = db.execute(
+        select(user_rollup.c.owner_id, User.username, user_rollup.c.total, user_rollup.c.completed)
+        .join(User, User.id == user_rollup.c.owner_id, isouter=True)
+        .where(user_rollup.c.owner_id > after_id, user_rollup.c.total > 0)
+        .order_by(user_rollup.c.owner_id)
+        .limit(limit)
+    ).all()
+    return {
+        "refreshed_at": refreshed_at(db),
+        "users": [
+            {"user_id": owner_id, "username": username, "total_tasks": total,
+             "completed_tasks": completed, "active_tasks": total - completed}
+            for owner_id, username, total, completed in rows
+        ],
+        "next_after_id": rows[-1].owner_id if len(rows) == limit else None,
+    }
+
+
+@router.get("/throughput")
+async def completion_throughput(
+    days: int = Query(30, ge=1, le=366),
+    db: Session = Depends(get_db)
+):
+    """Создано и завершено задач по дням"""
+    start = _today() - timedelta(days=days - 1)
+    counts = {
+        day: (created, completed)
+        for day, created, completed in db.execute(
+            select(daily_rollup.c.day, daily_rollup.c.created, daily_rollup.c.completed)
+            .where(daily_rollup.c.day >= start)
+        ).all()
+    }
+    series = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        created, completed = counts.get(day, (0, 0))
+        series.append({"day": day, "created": created, "completed": completed})
+    return {"refreshed_at": refreshed_at(db), "days": series}
+
+
+@router.get("/overdue")
+async def overdue_by_priority(db: Session = Depends(get_db)):
+    """Открытые просроченные задачи по приоритету (срок раньше сегодняшнего дня)"""
+    today = _today()
+    rows = db.execute(
+        select(
+            due_rollup.c.priority,
+            func.sum(due_rollup.c.open).filter(due_rollup.c.due_day < today),
+            func.sum(due_rollup.c.open).filter(due_rollup.c.due_day == today),
+        ).group_by(due_rollup.c.priority)
+    ).all()
+    return {
+        "refreshed_at": refreshed_at(db),
+        "overdue": {priority: int(overdue or 0) for priority, overdue, _ in rows},
+        "due_today": {priority: int(due_today or 0) for priority, _, due_today in rows},
+    }
+
+
+@router.get("/burndown")
+async def burndown(
+    days: int = Query(30, ge=1, le=366),
+    db: Session = Depends(get_db)
+):
+    """
+    Открытые задачи на конец каждого дня
+
+    Считается назад от текущего числа открытых задач:
+    открыто(d-1) = открыто(d) - создано(d) + завершено(d)
+    """
+    today = _today()
+    start = today - timedelta(days=days - 1)
+    total, completed = db.execute(
+        select(func.coalesce(func.sum(user_rollup.c.total), 0),
+               func.coalesce(func.sum(user_rollup.c.completed), 0))
+    ).one()
+    counts = {
+        day: (created, done)
+        for day, created, done in db.execute(
+            select(daily_rollup.c.day, daily_rollup.c.created, daily_rollup.c.completed)
+            .where(daily_rollup.c.day >= start)
+        ).all()
+    }
+
+    remaining = int(total) - int(completed)
+    series = []
+    for offset in range(days):
+        day = today - timedelta(days=offset)
+        created, done = counts.get(day, (0, 0))
+        series.append({"day": day, "open": remaining, "created": created, "completed": done})
+        remaining = remaining - created + done
+    series.reverse()
+    return {"refreshed_at": refreshed_at(db), "days": series}
@@ -0,0 +1,140 @@
+"""
+Profiling API
+Профилирование текущего процесса по запросу (только для админов)
+
+Запрос обслуживает один воркер одного пода; hostname и pid в ответах
+показывают, какой именно процесс профилировался.
+
+Снимки tracemalloc живут в памяти одного воркера. Когда воркеров несколько,
+/memory/start возвращает pid, и остальные запросы /memory/* обязаны передать
+его (?pid=...): запрос, попавший в другой воркер, получает 409 и повторяется.
+"""
+import os
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+
+from ..core.profiler import (
+    PROFILE_DEFAULT_INTERVAL,
+    PROFILE_MAX_SECONDS,
+    PROFILING_ENABLED,
+    ProfilerBusy,
+    allocation_tracker,
+    multiple_workers,
+    process_info,
+    render_collapsed,
+    render_flamegraph,
+    sampling_profiler,
+)
+from ..core.security import get_current_active_admin
+
+
+def profiling_enabled():
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+
+
+router = APIRouter(
+    prefix="/api/admin/profiling",
+    tags=["Profiling"],
+    dependencies=[Depends(profiling_enabled), Depends(get_current_active_admin)],
+)
+
+
+# ==================== CPU ====================
+
+@router.post("/cpu")
+async def profile_cpu(
+    seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS),
+    interval: float = Query(PROFILE_DEFAULT_INTERVAL, ge=0.001, le=1),
+    format: Literal["collapsed", "flamegraph"] = "collapsed",
+):
+    """
+    Семплирование стеков всех потоков процесса в течение seconds секунд
+
+    collapsed — текст для flamegraph.pl/speedscope, flamegraph — SVG-файл
+    """
+    try:
+        result = await run_in_threadpool(sampling_profiler.run, seconds, interval)
+    except ProfilerBusy:
+        raise HTTPException(status_code=409, detail="Profiling is already running")
+
+    info = process_info()
+    headers = {
+        "X-Profile-Host": info["hostname"],
+        "X-Profile-Pid": str(info["pid"]),
+        "X-Profile-Samples": str(result["samples"]),
+    }
+    if format == "flamegraph":
+        title = f"{info['hostname']} pid {info['pid']}, {result['duration']:.1f}s"
+        headers["Content-Disposition"] = f'attachment; filename="flamegraph-{info["pid"]}.svg"'
+        return Response(render_flamegraph(result["stacks"], title), media_type="image/svg+xml", headers=headers)
+    return Response(render_collapsed(result["stacks"]), media_type="text/plain", headers=headers)
+
+
+# ==================== MEMORY ====================
+
+def memory_worker(pid: Optional[int] = Query(None, description="pid из ответа /memory/start")):
+    """Запрос /memory/* должен попасть в тот воркер, где включён tracemalloc"""
+    if pid is None:
+        if multiple_workers():
+            raise HTTPException(
+                status_code=400,
+                detail="pid is required when several workers serve the pod (see /memory/start)"
+            )
+        return
+    if pid != os.getpid():
+        raise HTTPException(
+            status_code=409,
+            detail=f"Request reached worker pid {os.getpid()}, not {pid}; retry",
+            headers={"X-Profile-Pid": str(os.getpid())}
+        )
+
+
+@router.post("/memory/start")
+async def start_memory_tracing(frames: int = Query(10, ge=1, le=100)):
+    """Включение tracemalloc (замедляет аллокации, пока включено)"""
+    allocation_tracker.start(frames)
+    return {**process_info(), "tracing": True}
+
+
+@router.post("/memory/stop", dependencies=[Depends(memory_worker)])
+async def stop_memory_tracing():
+    """Выключение tracemalloc и удаление снимков"""
+    allocation_tracker.stop()
+    return {**process_info(), "tracing": False}
+
+
+@router.post("/memory/snapshots", dependencies=[Depends(memory_worker)])
+async def take_memory_snapshot(
+    limit: int = Query(20, ge=1, le=500),
+    group_by: Literal["lineno", "filename", "traceback"] = "lineno",
+):
+    """Снимок аллокаций и топ мест по объёму"""
+    if not allocation_tracker.active:
+        raise HTTPException(status_code=409, detail="Memory tracing is not running")
+    result = await run_in_threadpool(allocation_tracker.snapshot, limit, group_by)
+    return {**process_info(), **result}
+
+
+@router.get("/memory/snapshots", dependencies=[Depends(memory_worker)])
+async def list_memory_snapshots():
+    return {**process_info(), "tracing": allocation_tracker.active,
+            "snapshots": allocation_tracker.snapshot_ids()}
+
+
+@router.get("/memory/diff", dependencies=[Depends(memory_worker)])
+async def diff_memory_snapshots(
+    first: int = Query(..., alias="from"),
+    second: int = Query(..., alias="to"),
+    limit: int = Query(20, ge=1, le=500),
+    group_by: Literal["lineno", "filename", "traceback"] = "lineno",
+):
+    """Рост аллокаций между двумя снимками"""
+    try:
+        result = await run_in_threadpool(allocation_tracker.diff, first, second, limit, group_by)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    return {**process_info(), **result}
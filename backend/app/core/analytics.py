@@ -0,0 +1,425 @@
+"""
+Analytics Module
+Агрегаты для админских дашбордов: rollup-таблицы на основной базе,
+обновляемые инкрементально по водяному знаку Task.updated_at
+
+    analytics_task_state   последний вклад каждой задачи в агрегаты
+    analytics_user_rollup  задачи по пользователям (всего / завершено)
+    analytics_daily_rollup создано / завершено по дням
+    analytics_due_rollup   открытые задачи по приоритету и дню срока
+    analytics_watermarks   водяной знак updated_at по шардам
+
+За проход читаются только задачи, изменённые после водяного знака (с
+перекрытием ANALYTICS_WATERMARK_OVERLAP на долгие транзакции), и удалённые
+через API (Redis-множество analytics:deleted). Для каждой задачи из агрегатов
+вычитается прежний вклад и прибавляется новый, поэтому повторная обработка
+безопасна. Архивация и перенос между шардами не меняют id и не трогают агрегаты.
+Первый проход по шарду (водяного знака ещё нет) читает и архивную таблицу.
+
+Полная пересборка (горячие и архивные таблицы всех шардов):
+    python -m app.core.analytics --rebuild
+"""
+import argparse
+import asyncio
+import os
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import structlog
+from prometheus_client import Counter as MetricCounter
+from sqlalchemy import column, select, table, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Connection, Engine
+from starlette.concurrency import run_in_threadpool
+
+from .archive import ARCHIVE_TABLE, archive_table
+from .database import engine
+from .redis_client import redis_client
+from .sharding import shard_router
+from ..models.models import Task
+
+logger = structlog.get_logger(__name__)
+
+ANALYTICS_ENABLED = os.getenv("ANALYTICS_ENABLED", "true").lower() == "true"
+ANALYTICS_REFRESH_INTERVAL = int(os.getenv("ANALYTICS_REFRESH_INTERVAL", "60"))
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "5000"))
+ANALYTICS_WATERMARK_OVERLAP = timedelta(seconds=int(os.getenv("ANALYTICS_WATERMARK_OVERLAP", "300")))
+
+DELETED_KEY = "analytics:deleted"
+# Ключ pg_advisory_lock: обновление агрегатов выполняет только один под
+ANALYTICS_LOCK_KEY = 7_203_116
+
+ROLLUP_ROWS_APPLIED = MetricCounter('analytics_rollup_tasks_applied_total', 'Tasks applied to analytics rollups')
+
+state_table = table(
+    "analytics_task_state",
+    column("task_id"), column("owner_id"), column("priority"),
+    column("created_day"), column("completed_day"), column("due_day"), column("completed"),
+)
+user_rollup = table("analytics_user_rollup", column("owner_id"), column("total"), column("completed"))
+daily_rollup = table("analytics_daily_rollup", column("day"), column("created"), column("completed"))
+due_rollup = table("analytics_due_rollup", column("priority"), column("due_day"), column("open"))
+watermarks = table("analytics_watermarks", column("shard"), column("updated_at"), column("refreshed_at"))
+
+STATE_COLUMNS = ("owner_id", "priority", "created_day", "completed_day", "due_day", "completed")
+
+
+def ensure_analytics_tables(conn: Connection):
+    """Создание rollup-таблиц (идемпотентно)"""
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS analytics_task_state (
+            task_id BIGINT PRIMARY KEY,
+            owner_id INTEGER NOT NULL,
+            priority TEXT NOT NULL,
+            created_day DATE NOT NULL,
+            completed_day DATE,
+            due_day DATE,
+            completed BOOLEAN NOT NULL
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS analytics_user_rollup (
+            owner_id INTEGER PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS analytics_daily_rollup (
+            day DATE PRIMARY KEY,
+            created INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS analytics_due_rollup (
+            priority TEXT NOT NULL,
+            due_day DATE NOT NULL,
+            open INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (priority, due_day)
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS analytics_watermarks (
+            shard INTEGER PRIMARY KEY,
+            updated_at TIMESTAMPTZ NOT NULL,
+            refreshed_at TIMESTAMPTZ NOT NULL
+        )
+    """))
+
+
+# ==================== CONTRIBUTIONS ====================
+
+def _day(value: Optional[datetime]) -> Optional[date]:
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+
+def task_state(row) -> tuple:
+    """Вклад задачи в агрегаты (в порядке STATE_COLUMNS)"""
+    priority = getattr(row.priority, "value", row.priority)
+    return (
+        row.owner_id,
+        str(priority),
+        _day(row.created_at),
+        _day(row.completed_at) if row.completed else None,
+        _day(row.due_date),
+        bool(row.completed),
+    )
+
+
+class RollupDelta:
+    """Накопленные изменения агрегатов для одной транзакции"""
+
+    def __init__(self):
+        self.users: Dict[int, Counter] = {}
+        self.days: Dict[date, Counter] = {}
+        self.due: Counter = Counter()
+
+    def apply(self, state: tuple, sign: int):
+        owner_id, priority, created_day, completed_day, due_day, completed = state
+        user = self.users.setdefault(owner_id, Counter())
+        user["total"] += sign
+        self.days.setdefault(created_day, Counter())["created"] += sign
+        if completed:
+            user["completed"] += sign
+            if completed_day is not None:
+                self.days.setdefault(completed_day, Counter())["completed"] += sign
+        elif due_day is not None:
+            self.due[(priority, due_day)] += sign
+
+    def write(self, conn: Connection):
+        user_rows = [{"owner_id": owner_id, "total": c["total"], "completed": c["completed"]}
+                     for owner_id, c in self.users.items() if any(c.values())]
+        if user_rows:
+            stmt = pg_insert(user_rollup).values(user_rows)
+            conn.execute(stmt.on_conflict_do_update(
+                index_elements=["owner_id"],
+                set_={"total": user_rollup.c.total + stmt.excluded.total,
+                      "completed": user_rollup.c.completed + stmt.excluded.completed}
+            ))
+
+        day_rows = [{"day": day, "created": c["created"], "completed": c["completed"]}
+                    for day, c in self.days.items() if any(c.values())]
+        if day_rows:
+            stmt = pg_insert(daily_rollup).values(day_rows)
+            conn.execute(stmt.on_conflict_do_update(
+                index_elements=["day"],
+                set_={"created": daily_rollup.c.created + stmt.excluded.created,
+                      "completed": daily_rollup.c.completed + stmt.excluded.completed}
+            ))
+
+        due_rows = [{"priority": priority, "due_day": due_day, "open": count}
+                    for (priority, due_day), count in self.due.items() if count]
+        if due_rows:
+            stmt = pg_insert(due_rollup).values(due_rows)
+            conn.execute(stmt.on_conflict_do_update(
+                index_elements=["priority", "due_day"],
+                set_={"open": due_rollup.c.open + stmt.excluded.open}
+            ))
+            conn.execute(due_rollup.delete().where(due_rollup.c.open <= 0))
+
+
+def _load_states(conn: Connection, task_ids: List[int]) -> Dict[int, tuple]:
+    rows = conn.execute(
+        select(state_table.c.task_id, *[state_table.c[name] for name in STATE_COLUMNS])
+        .where(state_table.c.task_id.in_(task_ids))
+    ).all()
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def apply_changes(conn: Connection, rows) -> int:
+    """Применение изменённых задач: старый вклад вычитается, новый прибавляется"""
+    new_states = {row.id: task_state(row) for row in rows}
+    if not new_states:
+        return 0
+    old_states = _load_states(conn, list(new_states))
+
+    delta = RollupDelta()
+    changed = []
+    for task_id, state in new_states.items():
+        old = old_states.get(task_id)
+        if old == state:
+            continue
+        if old is not None:
+            delta.apply(old, -1)
+        delta.apply(state, +1)
+        changed.append({"task_id": task_id, **dict(zip(STATE_COLUMNS, state))})
+
+    if changed:
+        delta.write(conn)
+        stmt = pg_insert(state_table).values(changed)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=["task_id"],
+            set_={name: stmt.excluded[name] for name in STATE_COLUMNS}
+        ))
+    ROLLUP_ROWS_APPLIED.inc(len(changed))
+    return len(changed)
+
+
+def apply_deletes(conn: Connection, task_ids: List[int]) -> int:
+    """Удалённые задачи: вклад вычитается, состояние удаляется"""
+    old_states = _load_states(conn, task_ids)
+    if not old_states:
+        return 0
+    delta = RollupDelta()
+    for state in old_states.values():
+        delta.apply(state, -1)
+    delta.write(conn)
+    conn.execute(state_table.delete().where(state_table.c.task_id.in_(list(old_states))))
+    return len(old_states)
+
+
+# ==================== REFRESH ====================
+
+def mark_deleted(task_id: int):
+    """Задача удалена через API (вызывается из delete_task)"""
+    try:
+        redis_client.client.sadd(DELETED_KEY, task_id)
+    except Exception as e:
+        logger.warning("analytics_mark_deleted_failed", task_id=task_id, error=str(e))
+
+
+def _changed_rows(source: Engine, source_table, since: datetime, after: Tuple[datetime, int], batch_size: int):
+    columns = [source_table.c[name] for name in
+               ("id", "owner_id", "priority", "created_at", "completed_at", "due_date", "completed", "updated_at")]
+    with source.connect() as conn:
+        return conn.execute(
+            select(*columns)
+            .where(source_table.c.updated_at >= since,
+                   tuple_(source_table.c.updated_at, source_table.c.id) > tuple_(*after))
+            .order_by(source_table.c.updated_at, source_table.c.id)
+            .limit(batch_size)
+        ).all()
+
+
+def _refresh_shard(shard: int, source_table=None, since: Optional[datetime] = None,
+                   batch_size: int = ANALYTICS_BATCH_SIZE) -> int:
+    """Изменённые задачи одного шарда, пачками по (updated_at, id)"""
+    source = shard_router.engine_for_shard(shard)
+    source_table = source_table if source_table is not None else Task.__table__
+    track_watermark = since is None
+
+    if since is None:
+        started = datetime.now(timezone.utc)
+        with engine.connect() as conn:
+            watermark = conn.execute(
+                select(watermarks.c.updated_at).where(watermarks.c.shard == shard)
+            ).scalar()
+        if watermark:
+            since = watermark - ANALYTICS_WATERMARK_OVERLAP
+        else:
+            # Первый проход по шарду: задачи, уже ушедшие в архив, тоже входят в агрегаты
+            since = datetime.min.replace(tzinfo=timezone.utc)
+            if _has_archive(source):
+                applied_archive = _refresh_shard(shard, archive_table, since, batch_size)
+                logger.info("analytics_archive_seeded", shard=shard, applied=applied_archive)
+
+    applied = 0
+    after = (since, -1)
+    while True:
+        rows = _changed_rows(source, source_table, since, after, batch_size)
+        if not rows:
+            break
+        with engine.begin() as conn:
+            applied += apply_changes(conn, rows)
+            if track_watermark:
+                stmt = pg_insert(watermarks).values(shard=shard, updated_at=rows[-1].updated_at,
+                                                    refreshed_at=datetime.now(timezone.utc))
+                conn.execute(stmt.on_conflict_do_update(
+                    index_elements=["shard"],
+                    set_={"updated_at": stmt.excluded.updated_at, "refreshed_at": stmt.excluded.refreshed_at}
+                ))
+        after = (rows[-1].updated_at, rows[-1].id)
+        if len(rows) < batch_size:
+            break
+
+    if track_watermark:
+        # Водяной знак появляется и у шарда без задач, иначе архив засевался бы на каждом проходе
+        stmt = pg_insert(watermarks).values(shard=shard, updated_at=started,
+                                            refreshed_at=datetime.now(timezone.utc))
+        with engine.begin() as conn:
+            conn.execute(stmt.on_conflict_do_update(
+                index_elements=["shard"], set_={"refreshed_at": stmt.excluded.refreshed_at}
+            ))
+    return applied
+
+
+def _has_archive(source: Engine) -> bool:
+    with source.connect() as conn:
+        return conn.execute(text("SELECT to_regclass(:name)"), {"name": ARCHIVE_TABLE}).scalar() is not None
+
+
+def _refresh_deletes(batch_size: int = ANALYTICS_BATCH_SIZE) -> int:
+    client = redis_client.client
+    removed = 0
+    while True:
+        members = client.srandmember(DELETED_KEY, batch_size)
+        if not members:
+            return removed
+        task_ids = [int(member) for member in members]
+        with engine.begin() as conn:
+            removed += apply_deletes(conn, task_ids)
+        client.srem(DELETED_KEY, *members)
+        if len(members) < batch_size:
+            return removed
+
+
+def _locked(fn):
+    """Выполнение под pg_advisory_lock на основной базе (0, если занято другим подом)"""
+    with engine.connect() as lock_conn:
+        if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:key)"),
+                                 {"key": ANALYTICS_LOCK_KEY}).scalar():
+            return None
+        try:
+            with engine.begin() as conn:
+                ensure_analytics_tables(conn)
+            return fn()
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ANALYTICS_LOCK_KEY})
+            lock_conn.commit()
+
+
+def refresh_once() -> Optional[dict]:
+    """Инкрементальное обновление агрегатов по всем шардам"""
+    def run():
+        applied = {shard: _refresh_shard(shard) for shard in sorted(shard_router.engines)}
+        deleted = _refresh_deletes()
+        if any(applied.values()) or deleted:
+            logger.info("analytics_refreshed", applied=sum(applied.values()), deleted=deleted)
+        return {"applied": applied, "deleted": deleted}
+    return _locked(run)
+
+
+def rebuild() -> Optional[dict]:
+    """Полная пересборка агрегатов из горячих и архивных таблиц всех шардов"""
+    def run():
+        started = datetime.now(timezone.utc)
+        with engine.begin() as conn:
+            conn.execute(text("""
+                TRUNCATE analytics_task_state, analytics_user_rollup, analytics_daily_rollup,
+                         analytics_due_rollup, analytics_watermarks
+            """))
+        redis_client.client.delete(DELETED_KEY)
+
+        since = datetime.min.replace(tzinfo=timezone.utc)
+        applied = 0
+        for shard in sorted(shard_router.engines):
+            if _has_archive(shard_router.engine_for_shard(shard)):
+                applied += _refresh_shard(shard, archive_table, since)
+            applied += _refresh_shard(shard, Task.__table__, since)
+            # Дальше инкрементально с момента начала пересборки
+            with engine.begin() as conn:
+                conn.execute(pg_insert(watermarks).values(
+                    shard=shard, updated_at=started, refreshed_at=datetime.now(timezone.utc)
+                ).on_conflict_do_nothing())
+        logger.info("analytics_rebuilt", applied=applied)
+        return {"applied": applied}
+    return _locked(run)
+
+
+class RollupRefresher:
+    """Периодическое обновление агрегатов в фоне (в рамках процесса приложения)"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            try:
+                await run_in_threadpool(refresh_once)
+            except Exception as e:
+                logger.error("analytics_refresh_failed", error=str(e))
+            await asyncio.sleep(ANALYTICS_REFRESH_INTERVAL)
+
+    def start(self):
+        if ANALYTICS_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+rollup_refresher = RollupRefresher()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh analytics rollup tables")
+    parser.add_argument("--rebuild", action="store_true", help="полная пересборка вместо инкрементального прохода")
+    args = parser.parse_args()
+    result = rebuild() if args.rebuild else refresh_once()
+    print(result if result is not None else "another process holds the analytics lock")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Archive Module
+Перенос давно завершённых задач из горячей таблицы в архивную,
+секционированную по месяцам (RANGE по completed_at)
+"""
+import asyncio
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+import structlog
+from prometheus_client import Counter
+from sqlalchemy import column, table, text
+from sqlalchemy.engine import Connection, Engine
+from starlette.concurrency import run_in_threadpool
+
+from .cache import tasks_list_cache
+from .database import engine
+from .sharding import shard_router
+from ..models.models import Task
+
+logger = structlog.get_logger(__name__)
+
+TASKS_ARCHIVED = Counter('tasks_archived_total', 'Tasks moved to the archive table')
+
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "true").lower() == "true"
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "5000"))
+ARCHIVE_INTERVAL = int(os.getenv("ARCHIVE_INTERVAL", "3600"))
+
+HOT_TABLE = Task.__tablename__
+ARCHIVE_TABLE = f"{HOT_TABLE}_archive"
+
+# Ключ pg_advisory_lock: архивацию выполняет только один под
+ARCHIVE_LOCK_KEY = 7_203_114
+
+# Архивная таблица для запросов (те же колонки + archived_at)
+archive_table = table(
+    ARCHIVE_TABLE,
+    *[column(c.name, c.type) for c in Task.__table__.columns],
+    column("archived_at"),
+)
+
+
+def _archive_columns() -> str:
+    return ", ".join(c.name for c in Task.__table__.columns)
+
+
+def _month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def _next_month(value: date) -> date:
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def ensure_archive_table(conn: Connection):
+    """
+    Создание архивной таблицы и индексов (идемпотентно)
+
+    Вызывается при старте из apply_schema_extensions (app/core/schema.py), поэтому
+    запросы к архиву работают и до первого прохода архиватора. Месячные секции
+    создаются лениво перед вставкой (ensure_partitions); чтение из таблицы
+    без секций просто возвращает пустой результат.
+    """
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {ARCHIVE_TABLE} (
+            LIKE {HOT_TABLE} INCLUDING DEFAULTS,
+            archived_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        ) PARTITION BY RANGE (completed_at)
+    """))
+    conn.execute(text(f"""
+        CREATE INDEX IF NOT EXISTS ix_{ARCHIVE_TABLE}_owner_completed
+        ON {ARCHIVE_TABLE} (owner_id, completed_at DESC)
+    """))
+    conn.execute(text(f"""
+        CREATE INDEX IF NOT EXISTS ix_{ARCHIVE_TABLE}_id ON {ARCHIVE_TABLE} (id)
+    """))
+    conn.execute(text(f"""
+        CREATE INDEX IF NOT EXISTS ix_{ARCHIVE_TABLE}_tags ON {ARCHIVE_TABLE} USING GIN (tags)
+    """))
+
+
+def ensure_partitions(conn: Connection, start: date, end: date):
+    """Месячные секции, покрывающие интервал [start, end]"""
+    month = _month_start(start)
+    while month <= end:
+        upper = _next_month(month)
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {ARCHIVE_TABLE}_{month:%Y_%m}
+            PARTITION OF {ARCHIVE_TABLE}
+            FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')
+        """))
+        month = upper
+
+
+def archive_once(bind: Optional[Engine] = None, older_than_days: int = ARCHIVE_AFTER_DAYS,
+                 batch_size: int = ARCHIVE_BATCH_SIZE, max_batches: Optional[int] = None) -> int:
+    """
+    Перенос завершённых задач старше older_than_days в архив
+
+    Каждая пачка переносится одним выражением (DELETE ... RETURNING внутри INSERT)
+    в отдельной транзакции, чтобы не держать длинные блокировки. После каждой
+    пачки сбрасывается кэш списков: перенесённые задачи из них пропадают.
+
+    Returns:
+        Количество перенесённых задач (0, если архивацию выполняет другой под)
+    """
+    bind = bind or engine
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    columns = _archive_columns()
+    moved_total = 0
+
+    # Блокировка на AUTOCOMMIT-соединении: оно не висит idle in transaction всё время переноса
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+        if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:key)"),
+                                 {"key": ARCHIVE_LOCK_KEY}).scalar():
+            return 0
+        try:
+            with bind.begin() as conn:
+                oldest = conn.execute(text(f"""
+                    SELECT min(completed_at) FROM {HOT_TABLE}
+                    WHERE completed AND completed_at < :cutoff
+                """), {"cutoff": cutoff}).scalar()
+                if oldest is None:
+                    return 0
+                ensure_partitions(conn, oldest.date(), cutoff.date())
+
+            batches = 0
+            while max_batches is None or batches < max_batches:
+                with bind.begin() as conn:
+                    moved = conn.execute(text(f"""
+                        WITH moved AS (
+                            DELETE FROM {HOT_TABLE}
+                            WHERE id IN (
+                                SELECT id FROM {HOT_TABLE}
+                                WHERE completed AND completed_at < :cutoff
+                                ORDER BY completed_at
+                                LIMIT :batch_size
+                                FOR UPDATE SKIP LOCKED
+                            )
+                            RETURNING {columns}
+                        )
+                        INSERT INTO {ARCHIVE_TABLE} ({columns})
+                        SELECT {columns} FROM moved
+                    """), {"cutoff": cutoff, "batch_size": batch_size}).rowcount
+                if moved:
+                    tasks_list_cache.flush("tasks:list:*")
+                moved_total += moved
+                TASKS_ARCHIVED.inc(moved)
+                batches += 1
+                if moved < batch_size:
+                    break
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ARCHIVE_LOCK_KEY})
+
+    if moved_total:
+        logger.info("tasks_archived", count=moved_total, cutoff=cutoff.isoformat())
+    return moved_total
+
+
+class Archiver:
+    """Периодическая архивация в фоне (в рамках процесса приложения)"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            for shard, shard_engine in shard_router.engines.items():
+                try:
+                    await run_in_threadpool(archive_once, shard_engine)
+                except Exception as e:
+                    logger.error("archive_failed", shard=shard, error=str(e))
+            await asyncio.sleep(ARCHIVE_INTERVAL)
+
+    def start(self):
+        if ARCHIVE_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+archiver = Archiver()
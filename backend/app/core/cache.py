@@ -0,0 +1,281 @@
+"""
+Cache Module
+Кэширование с защитой от cache stampede:
+single-flight внутри процесса, короткая Redis-блокировка между подами
+и вероятностное раннее обновление (XFetch) для горячих ключей
+
+Инвалидация (delete, flush) увеличивает счётчик поколения; пересчёт,
+начатый до неё, сравнивает поколение при записи и не возвращает в кэш
+устаревшее значение.
+"""
+import asyncio
+import json
+import math
+import os
+import random
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import structlog
+from prometheus_client import Counter
+from starlette.concurrency import run_in_threadpool
+
+from .redis_client import redis_client
+
+logger = structlog.get_logger(__name__)
+
+CACHE_REQUESTS = Counter('cache_requests_total', 'Cache lookups', ['cache', 'result'])
+CACHE_RECOMPUTES = Counter('cache_recomputes_total', 'Cache recomputations', ['cache', 'reason'])
+
+LOCK_TTL_MS = int(os.getenv("CACHE_LOCK_TTL_MS", "5000"))
+LOCK_POLL_INTERVAL = float(os.getenv("CACHE_LOCK_POLL_INTERVAL", "0.05"))
+EARLY_REFRESH_BETA = float(os.getenv("CACHE_EARLY_REFRESH_BETA", "1.0"))
+# Отсутствующее значение (например, 404) кэшируется ненадолго,
+# чтобы ожидающие поды получили ответ, но новые данные не скрывались
+NEGATIVE_TTL = int(os.getenv("CACHE_NEGATIVE_TTL", "5"))
+# Сколько хранится поколение отдельного ключа (должно быть больше любого пересчёта)
+KEY_GENERATION_TTL = int(os.getenv("CACHE_KEY_GENERATION_TTL", "3600"))
+
+# Снятие блокировки только её владельцем
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Запись, только если поколения кэша (KEYS[2]) и ключа (KEYS[3]) не менялись
+# с начала пересчёта (ARGV[2], ARGV[3])
+WRITE_IF_GENERATION_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[2] or (redis.call('GET', KEYS[3]) or '0') ~= ARGV[3] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[4])
+return 1
+"""
+
+
+class StampedeProtectedCache:
+    """Кэш поверх Redis с защитой от одновременного пересчёта"""
+
+    def __init__(self, name: str, raw: bool = False):
+        """
+        Args:
+            name: имя кэша для метрик
+            raw: значения — готовые JSON-строки, хранятся и отдаются без перекодирования
+        """
+        self.name = name
+        self.raw = raw
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._release_script = None
+        self._write_script = None
+        self._generation_key = f"cache:generation:{name}"
+
+    @property
+    def redis(self):
+        return redis_client.client
+
+    def _release(self, lock_key: str, token: str):
+        if self._release_script is None:
+            self._release_script = self.redis.register_script(RELEASE_LOCK_SCRIPT)
+        self._release_script(keys=[lock_key], args=[token])
+
+    def _read(self, key: str) -> Optional[dict]:
+        try:
+            raw = self.redis.get(key)
+        except Exception as e:
+            logger.warning("cache_read_failed", key=key, error=str(e))
+            return None
+        if not raw:
+            return None
+        # Формат: "<время пересчёта>:<момент истечения>:<JSON значения>"
+        try:
+            if isinstance(raw, bytes):
+                raw = raw.decode()
+            delta, expiry, payload = raw.split(":", 2)
+            value = payload if self.raw else json.loads(payload)
+            return {"v": value, "d": float(delta), "e": float(expiry)}
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _key_generation_key(key: str) -> str:
+        return f"generation:{key}"
+
+    def _generation(self, key: str) -> Optional[Tuple[str, str]]:
+        """Поколения кэша и ключа на момент начала пересчёта (None — Redis недоступен)"""
+        try:
+            values = self.redis.mget([self._generation_key, self._key_generation_key(key)])
+        except Exception as e:
+            logger.warning("cache_generation_read_failed", key=key, error=str(e))
+            return None
+        return tuple(
+            (value.decode() if isinstance(value, bytes) else str(value)) if value is not None else "0"
+            for value in values
+        )
+
+    def _write(self, key: str, value: Any, ttl: int, delta: float, generation: Optional[Tuple[str, str]]):
+        if generation is None:
+            return
+        if value is None:
+            ttl = min(ttl, NEGATIVE_TTL)
+        payload = value if self.raw and value is not None else json.dumps(value, default=str)
+        try:
+            if self._write_script is None:
+                self._write_script = self.redis.register_script(WRITE_IF_GENERATION_SCRIPT)
+            written = self._write_script(
+                keys=[key, self._generation_key, self._key_generation_key(key)],
+                args=[f"{delta:.6f}:{time.time() + ttl:.3f}:{payload}", generation[0], generation[1], ttl]
+            )
+        except Exception as e:
+            logger.warning("cache_write_failed", key=key, error=str(e))
+            return
+        if not written:
+            logger.debug("cache_write_skipped_invalidated", key=key)
+
+    def _should_refresh_early(self, envelope: dict) -> bool:
+        """XFetch: чем ближе истечение и дороже пересчёт, тем выше шанс обновить заранее"""
+        delta = envelope.get("d", 0)
+        expiry = envelope.get("e", 0)
+        if delta <= 0:
+            return False
+        return time.time() - delta * EARLY_REFRESH_BETA * math.log(1.0 - random.random()) >= expiry
+
+    def delete(self, key: str):
+        """Удаление ключа (идущий пересчёт этого ключа результат не запишет)"""
+        generation_key = self._key_generation_key(key)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.incr(generation_key)
+            pipe.expire(generation_key, KEY_GENERATION_TTL)
+            pipe.delete(key)
+            pipe.execute()
+        except Exception as e:
+            logger.warning("cache_delete_failed", key=key, error=str(e))
+
+    def flush(self, pattern: str):
+        """
+        Удаление всех ключей кэша по шаблону (шаблон должен покрывать все ключи кэша)
+
+        Поколение увеличивается до удаления: пересчёты, начатые раньше, ничего не запишут.
+        """
+        try:
+            self.redis.incr(self._generation_key)
+        except Exception as e:
+            logger.warning("cache_flush_failed", cache=self.name, error=str(e))
+        redis_client.flush_pattern(pattern)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Any], ttl: int = 300) -> Any:
+        """
+        Получение значения из кэша или однократный пересчёт
+
+        Args:
+            key: ключ Redis
+            compute: синхронная функция, вычисляющая значение (выполняется в threadpool)
+            ttl: время жизни в секундах
+
+        Returns:
+            Значение из кэша либо свежевычисленное
+        """
+        envelope = self._read(key)
+        if envelope is not None:
+            if not self._should_refresh_early(envelope):
+                CACHE_REQUESTS.labels(cache=self.name, result="hit").inc()
+                logger.debug("cache_hit", key=key)
+                return envelope["v"]
+            # Раннее обновление: отдаём текущее значение, если пересчёт уже идёт
+            CACHE_REQUESTS.labels(cache=self.name, result="early_refresh").inc()
+            if key in self._inflight:
+                return envelope["v"]
+            return await self._single_flight(key, compute, ttl, stale=envelope)
+
+        CACHE_REQUESTS.labels(cache=self.name, result="miss").inc()
+        return await self._single_flight(key, compute, ttl)
+
+    async def _single_flight(self, key: str, compute: Callable[[], Any], ttl: int,
+                             stale: Optional[dict] = None) -> Any:
+        """Один пересчёт на ключ внутри процесса; остальные ждут его результат"""
+        future = self._inflight.get(key)
+        if future is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # Отменили ведущий запрос (клиент отключился) — пересчитываем сами
+                return await self._single_flight(key, compute, ttl, stale)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._compute_with_lock(key, compute, ttl, stale)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            # Ожидающие не должны висеть на future, который никто не завершит
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Исключение получат ожидающие; здесь помечаем его обработанным
+            future.exception()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    async def _compute_with_lock(self, key: str, compute: Callable[[], Any], ttl: int,
+                                 stale: Optional[dict]) -> Any:
+        """Пересчёт под Redis-блокировкой, общей для всех подов"""
+        lock_key = f"lock:{key}"
+        token = uuid.uuid4().hex
+        try:
+            acquired = self.redis.set(lock_key, token, nx=True, px=LOCK_TTL_MS)
+        except Exception as e:
+            logger.warning("cache_lock_failed", key=key, error=str(e))
+            acquired = True
+            token = None
+
+        if not acquired:
+            if stale is not None:
+                # Другой под уже обновляет ключ
+                return stale["v"]
+            # Ждём, пока владелец блокировки запишет значение
+            deadline = time.monotonic() + LOCK_TTL_MS / 1000
+            while time.monotonic() < deadline:
+                await asyncio.sleep(LOCK_POLL_INTERVAL)
+                envelope = self._read(key)
+                if envelope is not None:
+                    CACHE_REQUESTS.labels(cache=self.name, result="coalesced").inc()
+                    return envelope["v"]
+            logger.warning("cache_lock_wait_timeout", key=key)
+
+        try:
+            CACHE_RECOMPUTES.labels(cache=self.name, reason="early" if stale else "miss").inc()
+            generation = self._generation(key)
+            started = time.perf_counter()
+            value = await run_in_threadpool(compute)
+            self._write(key, value, ttl, time.perf_counter() - started, generation)
+            return value
+        finally:
+            if acquired and token:
+                try:
+                    self._release(lock_key, token)
+                except Exception as e:
+                    logger.warning("cache_unlock_failed", key=key, error=str(e))
+
+
+# Глобальные экземпляры кэша задач
+tasks_list_cache = StampedeProtectedCache("tasks_list", raw=True)
+task_cache = StampedeProtectedCache("task")
+
+
+def tasks_list_key(cache_key: str) -> str:
+    """Ключ страницы списка задач (сбрасывается по шаблону tasks:list:*)"""
+    return f"tasks:list:{cache_key}"
+
+
+def task_key(owner_id: int, task_id: int) -> str:
+    """Ключ отдельной задачи (с владельцем, чтобы кэш не отдавал чужие задачи)"""
+    return f"task:{owner_id}:{task_id}"
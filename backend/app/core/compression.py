@@ -0,0 +1,175 @@
+"""
+Compression Module
+Сжатие ответов по Accept-Encoding (zstd, br, gzip) с порогом размера
+
+Сжатый вариант кэшированного ответа хранится в Redis рядом с записью кэша
+под ключом "<ключ>|<кодировка>|<отпечаток тела>" и отдаётся без повторного
+сжатия. Отпечаток меняется вместе с телом, поэтому устаревший вариант
+не отдаётся и просто истекает по TTL.
+
+brotli и zstandard — необязательные зависимости: без них кодировка не предлагается.
+"""
+import gzip
+import hashlib
+import os
+from typing import Callable, Dict, Optional
+
+import structlog
+from fastapi import Request
+from fastapi.responses import Response
+from prometheus_client import Counter
+from starlette.concurrency import run_in_threadpool
+
+from .redis_client import redis_client
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = structlog.get_logger(__name__)
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "6"))
+
+RESPONSE_BYTES = Counter('http_response_body_bytes_total', 'Response body bytes on the wire', ['encoding'])
+COMPRESSED_VARIANTS = Counter('compressed_variant_requests_total', 'Pre-compressed variant lookups',
+                              ['encoding', 'result'])
+
+
+def _zstd_compress(body: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+
+
+ENCODERS: Dict[str, Callable[[bytes], bytes]] = {
+    "gzip": lambda body: gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0),
+}
+if brotli is not None:
+    ENCODERS["br"] = lambda body: brotli.compress(body, quality=BROTLI_QUALITY)
+if zstandard is not None:
+    ENCODERS["zstd"] = _zstd_compress
+
+# Предпочтение сервера при равных q
+PREFERENCE = ("zstd", "br", "gzip")
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Выбор кодировки по Accept-Encoding (RFC 9110, с q-значениями)
+
+    Returns:
+        Имя кодировки или None (без сжатия)
+    """
+    if not accept_encoding:
+        return None
+
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+
+    wildcard = weights.get("*")
+    best, best_q = None, 0.0
+    for name in PREFERENCE:
+        if name not in ENCODERS:
+            continue
+        q = weights.get(name, wildcard if wildcard is not None else 0.0)
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    return ENCODERS[encoding](body)
+
+
+def fingerprint(body: bytes) -> str:
+    return hashlib.blake2b(body, digest_size=8).hexdigest()
+
+
+def _variant_key(cache_key: str, encoding: str, body: bytes) -> str:
+    # Префикс ключа кэша сохраняется, поэтому сброс по шаблону (tasks:list:*) удаляет и варианты
+    return f"{cache_key}|{encoding}|{fingerprint(body)}"
+
+
+def _decode_responses() -> bool:
+    return bool(redis_client.client.connection_pool.connection_kwargs.get("decode_responses"))
+
+
+def _load_variant(key: str) -> Optional[bytes]:
+    try:
+        if _decode_responses():
+            # Клиент декодирует ответы в str — бинарные данные читаются отдельным вызовом
+            value = redis_client.client.execute_command("GET", key, NEVER_DECODE=True)
+        else:
+            value = redis_client.client.get(key)
+    except Exception as e:
+        logger.warning("compressed_variant_read_failed", key=key, error=str(e))
+        return None
+    return value
+
+
+def _store_variant(key: str, body: bytes, ttl: int):
+    try:
+        redis_client.client.set(key, body, ex=ttl)
+    except Exception as e:
+        logger.warning("compressed_variant_write_failed", key=key, error=str(e))
+
+
+async def compressed_response(
+    request: Request,
+    body: bytes,
+    cache_key: Optional[str] = None,
+    ttl: int = 300,
+    media_type: str = "application/json",
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """
+    Ответ, сжатый по Accept-Encoding клиента
+
+    Args:
+        request: запрос (заголовок Accept-Encoding)
+        body: тело без сжатия
+        cache_key: ключ записи кэша; если задан, сжатый вариант берётся из Redis
+            или сохраняется туда один раз
+        ttl: время жизни сжатого варианта
+    """
+    headers = {**(headers or {}), "Vary": "Accept-Encoding"}
+    encoding = negotiate(request.headers.get("accept-encoding")) if COMPRESSION_ENABLED else None
+    if encoding is None or len(body) < COMPRESSION_MIN_SIZE:
+        RESPONSE_BYTES.labels(encoding="identity").inc(len(body))
+        return Response(content=body, media_type=media_type, headers=headers)
+
+    compressed = None
+    if cache_key is not None:
+        variant_key = _variant_key(cache_key, encoding, body)
+        compressed = _load_variant(variant_key)
+        COMPRESSED_VARIANTS.labels(encoding=encoding, result="hit" if compressed else "miss").inc()
+
+    if compressed is None:
+        compressed = await run_in_threadpool(compress, body, encoding)
+        if cache_key is not None:
+            _store_variant(variant_key, compressed, ttl)
+
+    headers["Content-Encoding"] = encoding
+    RESPONSE_BYTES.labels(encoding=encoding).inc(len(compressed))
+    return Response(content=compressed, media_type=media_type, headers=headers)
@@ -0,0 +1,180 @@
+"""
+Log Pipeline Module
+Асинхронное структурированное логирование: события кладутся в ограниченную
+очередь, фоновый поток сериализует и пишет их пачками; горячие события сэмплируются
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, TextIO
+
+import structlog
+from prometheus_client import Counter
+
+LOG_EVENTS_DROPPED = Counter('log_events_dropped_total', 'Log events dropped', ['reason'])
+
+QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "256"))
+FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.5"))
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """Разбор строки вида 'cache_hit=0.01,task_updated=0.5'"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        event, _, rate = item.partition("=")
+        rates[event.strip()] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+
+class EventSampler:
+    """Процессор structlog: пропускает только долю событий с заданным именем"""
+
+    def __init__(self, rates: Dict[str, float]):
+        self.rates = rates
+
+    def __call__(self, logger, method_name, event_dict):
+        rate = self.rates.get(event_dict.get("event"))
+        if rate is not None and rate < 1.0 and random.random() >= rate:
+            LOG_EVENTS_DROPPED.labels(reason="sampled").inc()
+            raise structlog.DropEvent
+        return event_dict
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler без форматирования на пути запроса и с учётом переполнения"""
+
+    def prepare(self, record):
+        # Сериализация выполняется в фоновом потоке
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_EVENTS_DROPPED.labels(reason="queue_full").inc()
+
+
+class BatchLogWriter(threading.Thread):
+    """Фоновый поток: забирает записи из очереди и пишет их пачками"""
+
+    _STOP = object()
+
+    def __init__(self, log_queue: queue.Queue, formatter: logging.Formatter, stream: TextIO):
+        super().__init__(name="log-writer", daemon=True)
+        self.queue = log_queue
+        self.formatter = formatter
+        self.stream = stream
+
+    def run(self):
+        while True:
+            batch: List[logging.LogRecord] = []
+            try:
+                batch.append(self.queue.get(timeout=FLUSH_INTERVAL))
+                while len(batch) < BATCH_SIZE:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            stop = self._STOP in batch
+            self._write([record for record in batch if record is not self._STOP])
+            if stop:
+                return
+
+    def _write(self, records: List[logging.LogRecord]):
+        if not records:
+            return
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.formatter.format(record))
+            except Exception:
+                LOG_EVENTS_DROPPED.labels(reason="format_error").inc()
+        try:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+        except Exception:
+            LOG_EVENTS_DROPPED.labels(reason="write_error").inc()
+
+    def stop(self, timeout: float = 5.0):
+        """Дописать оставшиеся события и остановить поток (не дольше timeout секунд)"""
+        if not self.is_alive():
+            return
+        deadline = time.monotonic() + timeout
+        try:
+            # Полная очередь освобождается потоком записи; если он завис, не ждём дольше timeout
+            self.queue.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            LOG_EVENTS_DROPPED.labels(reason="shutdown_timeout").inc()
+            return
+        self.join(max(0.0, deadline - time.monotonic()))
+
+
+_writer: Optional[BatchLogWriter] = None
+
+
+def configure_logging(level: str = "INFO", sample_rates: Optional[Dict[str, float]] = None,
+                      stream: TextIO = sys.stdout):
+    """
+    Настройка structlog и stdlib logging с асинхронной записью
+
+    Args:
+        level: уровень логирования корневого логгера
+        sample_rates: доли сохраняемых событий по имени (например, {'cache_hit': 0.01})
+        stream: куда писать JSON-строки
+    """
+    global _writer
+
+    if sample_rates is None:
+        sample_rates = parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", "cache_hit=0.01"))
+
+    structlog.configure(
+        processors=[
+            structlog.stdlib.filter_by_level,
+            EventSampler(sample_rates),
+            structlog.processors.TimeStamper(fmt="iso"),
+            structlog.stdlib.ProcessorFormatter.wrap_for_formatter,
+        ],
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=True,
+    )
+
+    formatter = structlog.stdlib.ProcessorFormatter(
+        processor=structlog.processors.JSONRenderer(),
+        foreign_pre_chain=[
+            structlog.stdlib.add_log_level,
+            structlog.processors.TimeStamper(fmt="iso"),
+        ],
+    )
+
+    if _writer is not None:
+        _writer.stop()
+
+    log_queue: queue.Queue = queue.Queue(maxsize=QUEUE_SIZE)
+    _writer = BatchLogWriter(log_queue, formatter, stream)
+    _writer.start()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, AsyncQueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(AsyncQueueHandler(log_queue))
+    root.setLevel(level.upper())
+
+
+def shutdown_logging():
+    """Сброс очереди логов (при остановке приложения)"""
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,250 @@
+"""
+Profiler Module
+Профилирование работающего пода по запросу администратора:
+семплирующий профайлер стеков и снимки аллокаций tracemalloc
+
+Пока профилирование не запущено, ничего не работает: нет фонового потока,
+хуков sys.setprofile/settrace и трассировки аллокаций.
+"""
+import html
+import os
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "true").lower() == "true"
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_DEFAULT_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.01"))
+TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", "10"))
+MAX_SNAPSHOTS = 5
+
+
+class ProfilerBusy(Exception):
+    """Профилирование уже выполняется в этом процессе"""
+
+
+def process_info() -> dict:
+    """Какой процесс профилируется (в поде несколько воркеров)"""
+    return {"hostname": socket.gethostname(), "pid": os.getpid()}
+
+
+def multiple_workers() -> bool:
+    """Под обслуживают несколько воркеров (app/server.py задаёт PROMETHEUS_MULTIPROC_DIR только для них)"""
+    return bool(os.getenv("PROMETHEUS_MULTIPROC_DIR")) or int(os.getenv("WEB_CONCURRENCY", "1") or 1) > 1
+
+
+# ==================== SAMPLING PROFILER ====================
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame) -> str:
+    """Стек в формате collapsed: корень;...;лист"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    """
+    Семплирующий профайлер на sys._current_frames()
+
+    Отдельный поток раз в interval секунд снимает стеки всех потоков процесса.
+    Профилируемый код не инструментируется, поэтому накладные расходы
+    ограничены стоимостью снятия стеков.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def run(self, seconds: float, interval: float = PROFILE_DEFAULT_INTERVAL) -> dict:
+        """
+        Семплирование в течение seconds секунд (блокирующий вызов)
+
+        Returns:
+            {"stacks": Counter collapsed-стеков, "samples": ..., "duration": ...}
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy()
+        try:
+            seconds = min(seconds, PROFILE_MAX_SECONDS)
+            own_thread = threading.get_ident()
+            thread_names = {t.ident: t.name for t in threading.enumerate()}
+            stacks: Counter = Counter()
+            samples = 0
+
+            logger.info("profiling_started", seconds=seconds, interval=interval)
+            started = time.perf_counter()
+            deadline = started + seconds
+            while time.perf_counter() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread:
+                        continue
+                    thread = thread_names.get(thread_id) or f"thread-{thread_id}"
+                    stacks[f"{thread};{_collapse(frame)}"] += 1
+                samples += 1
+                time.sleep(interval)
+
+            duration = time.perf_counter() - started
+            logger.info("profiling_finished", samples=samples, stacks=len(stacks))
+            return {"stacks": stacks, "samples": samples, "duration": duration}
+        finally:
+            self._lock.release()
+
+
+def render_collapsed(stacks: Counter) -> str:
+    """Текст для flamegraph.pl / speedscope / inferno"""
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+
+def render_flamegraph(stacks: Counter, title: str = "CPU profile", width: int = 1200) -> str:
+    """Flamegraph в виде самостоятельного SVG-файла"""
+    # Дерево вызовов: узел = {имя: [количество, дети]}
+    root: Dict[str, list] = {}
+    total = 0
+    for stack, count in stacks.items():
+        total += count
+        level = root
+        for label in stack.split(";"):
+            node = level.setdefault(label, [0, {}])
+            node[0] += count
+            level = node[1]
+
+    row_height = 16
+    rects: List[tuple] = []
+    max_depth = 0
+
+    def walk(level: Dict[str, list], x: float, depth: int):
+        nonlocal max_depth
+        max_depth = max(max_depth, depth)
+        for label, (count, children) in sorted(level.items()):
+            w = width * count / total
+            if w >= 0.5:
+                rects.append((x, depth, w, label, count))
+                walk(children, x, depth + 1)
+            x += w
+
+    if total:
+        walk(root, 0.0, 0)
+
+    height = (max_depth + 1) * row_height + 30
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="monospace" font-size="11">',
+        f'<text x="4" y="14">{html.escape(title)} ({total} samples)</text>',
+    ]
+    for x, depth, w, label, count in rects:
+        y = height - (depth + 1) * row_height
+        hue = 10 + sum(map(ord, label)) % 40
+        text = html.escape(label)
+        visible = text if len(label) * 7 < w else ""
+        parts.append(
+            f'<g><title>{text} — {count} samples ({100 * count / total:.2f}%)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_height - 1}" '
+            f'fill="hsl({hue},90%,60%)"/>'
+            f'<text x="{x + 2:.1f}" y="{y + 11}">{visible[:int(w / 7)]}</text></g>'
+        )
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+
+# ==================== ALLOCATIONS ====================
+
+class AllocationTracker:
+    """Снимки tracemalloc, хранятся в памяти процесса"""
+
+    def __init__(self):
+        self._snapshots: Dict[int, tracemalloc.Snapshot] = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = TRACEMALLOC_FRAMES):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            logger.info("tracemalloc_started", frames=frames)
+
+    def stop(self):
+        """Остановка трассировки; снимки удаляются"""
+        with self._lock:
+            self._snapshots.clear()
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            logger.info("tracemalloc_stopped")
+
+    @staticmethod
+    def _filtered(snapshot: tracemalloc.Snapshot) -> tracemalloc.Snapshot:
+        return snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+    def snapshot(self, limit: int = 20, group_by: str = "lineno") -> dict:
+        """Снимок аллокаций и топ мест по объёму"""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running")
+        snapshot = self._filtered(tracemalloc.take_snapshot())
+        with self._lock:
+            snapshot_id = self._next_id
+            self._next_id += 1
+            self._snapshots[snapshot_id] = snapshot
+            # Старые снимки вытесняются, чтобы не держать память
+            while len(self._snapshots) > MAX_SNAPSHOTS:
+                self._snapshots.pop(min(self._snapshots))
+
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "snapshot_id": snapshot_id,
+            "traced_current_bytes": current,
+            "traced_peak_bytes": peak,
+            "top": [
+                {"location": str(stat.traceback), "size_bytes": stat.size, "count": stat.count}
+                for stat in snapshot.statistics(group_by)[:limit]
+            ],
+        }
+
+    def diff(self, first: int, second: int, limit: int = 20, group_by: str = "lineno") -> dict:
+        """Разница между двумя снимками (рост аллокаций)"""
+        with self._lock:
+            try:
+                old, new = self._snapshots[first], self._snapshots[second]
+            except KeyError as e:
+                raise KeyError(f"snapshot {e.args[0]} not found")
+        stats = new.compare_to(old, group_by)
+        return {
+            "from": first,
+            "to": second,
+            "top": [
+                {
+                    "location": str(stat.traceback),
+                    "size_diff_bytes": stat.size_diff,
+                    "size_bytes": stat.size,
+                    "count_diff": stat.count_diff,
+                }
+                for stat in stats[:limit]
+            ],
+        }
+
+    def snapshot_ids(self) -> List[int]:
+        with self._lock:
+            return sorted(self._snapshots)
+
+
+sampling_profiler = SamplingProfiler()
+allocation_tracker = AllocationTracker()
@@ -0,0 +1,219 @@
+"""
+Rate Limiting Module
+Token bucket в Redis (атомарно через Lua) и адаптивный сброс нагрузки
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import structlog
+from fastapi import Depends, HTTPException, Request, status
+from prometheus_client import Counter, Gauge
+from sqlalchemy.pool import QueuePool
+
+from .redis_client import redis_client
+from .security import get_current_user
+from .sharding import shard_router
+from ..models.models import User
+
+logger = structlog.get_logger(__name__)
+
+RATE_LIMITED = Counter('http_requests_rate_limited_total', 'Requests rejected by rate limiter', ['scope'])
+REQUESTS_SHED = Counter('http_requests_shed_total', 'Requests rejected by load shedding', ['reason'])
+ACTIVE_REQUESTS = Gauge('http_requests_active', 'Active requests', multiprocess_mode='livesum')
+
+# Настройки (запросов в секунду и размер пачки)
+USER_RATE = float(os.getenv("RATE_LIMIT_USER_RATE", "20"))
+USER_BURST = int(os.getenv("RATE_LIMIT_USER_BURST", "40"))
+IP_RATE = float(os.getenv("RATE_LIMIT_IP_RATE", "50"))
+IP_BURST = int(os.getenv("RATE_LIMIT_IP_BURST", "100"))
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Сколько доверенных прокси (Ingress, балансировщик) дописывают X-Forwarded-For;
+# 0 — заголовок игнорируется, берётся адрес соединения
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+MAX_ACTIVE_REQUESTS = int(os.getenv("LOAD_SHED_MAX_ACTIVE_REQUESTS", "200"))
+MAX_POOL_UTILIZATION = float(os.getenv("LOAD_SHED_MAX_POOL_UTILIZATION", "0.95"))
+SHED_RETRY_AFTER = int(os.getenv("LOAD_SHED_RETRY_AFTER", "1"))
+# Переполнение пула сверх pool_size (то же значение, с которым создаются движки)
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
+# Ведра из KEYS проверяются за один вызов (ARGV: now, затем rate и burst каждого).
+# Токены списываются только если во всех ведрах их достаточно.
+# Возвращает {allowed, retry_after_ms}.
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local allowed = 1
+local retry_after = 0
+local state = {}
+
+for i = 1, #KEYS do
+    local rate = tonumber(ARGV[i * 2])
+    local burst = tonumber(ARGV[i * 2 + 1])
+    local bucket = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or burst
+    local ts = tonumber(bucket[2]) or now
+
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+    if tokens < 1 then
+        allowed = 0
+        retry_after = math.max(retry_after, math.ceil((1 - tokens) * 1000 / rate))
+    end
+    state[i] = tokens
+end
+
+for i = 1, #KEYS do
+    local rate = tonumber(ARGV[i * 2])
+    local burst = tonumber(ARGV[i * 2 + 1])
+    local tokens = state[i]
+    if allowed == 1 then
+        tokens = tokens - 1
+    end
+    redis.call('HSET', KEYS[i], 'tokens', tokens, 'ts', now)
+    redis.call('PEXPIRE', KEYS[i], math.ceil(burst * 1000 / rate) + 1000)
+end
+
+return {allowed, retry_after}
+"""
+
+
+class RateLimiter:
+    """Token bucket rate limiter поверх Redis"""
+
+    def __init__(self):
+        self._script = None
+
+    def _get_script(self):
+        if self._script is None:
+            self._script = redis_client.client.register_script(TOKEN_BUCKET_SCRIPT)
+        return self._script
+
+    def _check(self, key: str, rate: float, burst: int) -> int:
+        """
+        Списание токена из ведра key одним обращением к Redis
+
+        Returns:
+            0 если запрос разрешён, иначе рекомендуемый Retry-After в секундах
+        """
+        try:
+            allowed, retry_after_ms = self._get_script()(
+                keys=[key],
+                args=[int(time.time() * 1000), rate, burst]
+            )
+        except Exception as e:
+            # Недоступность Redis не должна блокировать API
+            logger.warning("rate_limit_check_failed", error=str(e))
+            return 0
+
+        if allowed:
+            return 0
+        return max(1, -(-int(retry_after_ms) // 1000))
+
+    def check_user(self, user_id: int) -> int:
+        return self._check(f"ratelimit:user:{user_id}", USER_RATE, USER_BURST)
+
+    def check_ip(self, ip: str) -> int:
+        return self._check(f"ratelimit:ip:{ip}", IP_RATE, IP_BURST)
+
+
+rate_limiter = RateLimiter()
+
+
+def client_ip(request: Request) -> str:
+    """
+    IP клиента с учётом Ingress (X-Forwarded-For)
+
+    Левые элементы заголовка задаёт сам клиент, поэтому адрес берётся
+    TRUSTED_PROXY_HOPS-м справа: его дописал ближайший к клиенту доверенный прокси.
+    """
+    forwarded = request.headers.get("x-forwarded-for")
+    if TRUSTED_PROXY_HOPS > 0 and forwarded:
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        if hops:
+            return hops[-min(TRUSTED_PROXY_HOPS, len(hops))]
+    return request.client.host if request.client else "unknown"
+
+
+def ip_rate_limit(request: Request) -> int:
+    """
+    Лимит по IP до аутентификации (вызывается из middleware)
+
+    Проверяется для всех запросов, в том числе с неверным или отозванным
+    токеном, которые до лимита по пользователю не доходят.
+
+    Returns:
+        0 если запрос разрешён, иначе Retry-After в секундах
+    """
+    if not RATE_LIMIT_ENABLED:
+        return 0
+
+    ip = client_ip(request)
+    retry_after = rate_limiter.check_ip(ip)
+    if retry_after:
+        RATE_LIMITED.labels(scope="ip").inc()
+        logger.info("rate_limited", scope="ip", ip=ip, retry_after=retry_after)
+    return retry_after
+
+
+async def rate_limit(current_user: User = Depends(get_current_user)):
+    """Зависимость FastAPI: лимит запросов по пользователю (лимит по IP — ip_rate_limit)"""
+    if not RATE_LIMIT_ENABLED:
+        return
+
+    retry_after = rate_limiter.check_user(current_user.id)
+    if retry_after:
+        RATE_LIMITED.labels(scope="user").inc()
+        logger.info("rate_limited", scope="user", user_id=current_user.id, retry_after=retry_after)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+
+class LoadShedder:
+    """Отклонение запросов при перегрузке (in-flight запросы, пулы соединений БД)"""
+
+    def __init__(self):
+        self._active_requests = 0
+
+    @contextmanager
+    def track(self):
+        """
+        Учёт выполняющегося запроса
+
+        Единственное место учёта: число для решения should_shed (в этом процессе)
+        и метрика http_requests_active меняются вместе.
+        """
+        self._active_requests += 1
+        ACTIVE_REQUESTS.inc()
+        try:
+            yield
+        finally:
+            self._active_requests -= 1
+            ACTIVE_REQUESTS.dec()
+
+    def pool_utilization(self) -> float:
+        """Доля занятых соединений самого загруженного пула (основная база и шарды)"""
+        utilization = 0.0
+        for shard_engine in shard_router.engines.values():
+            pool = shard_engine.pool
+            if not isinstance(pool, QueuePool):
+                # Пул без ограничения размера (NullPool, StaticPool и т.п.)
+                continue
+            capacity = pool.size() + DB_MAX_OVERFLOW
+            if capacity > 0:
+                utilization = max(utilization, pool.checkedout() / capacity)
+        return utilization
+
+    def should_shed(self) -> Optional[str]:
+        """Причина отклонения запроса или None"""
+        if self._active_requests >= MAX_ACTIVE_REQUESTS:
+            return "active_requests"
+        if self.pool_utilization() >= MAX_POOL_UTILIZATION:
+            return "db_pool"
+        return None
+
+
+load_shedder = LoadShedder()
@@ -0,0 +1,335 @@
+"""
+Reminders Module
+Напоминания о сроках задач на sorted set Redis
+
+    reminders:due         task -> время напоминания (due_date - REMINDER_LEAD_SECONDS)
+    reminders:processing  task -> окончание аренды воркера
+
+create_task/update_task/delete_task поддерживают reminders:due, поэтому
+воркер не сканирует таблицу задач: за тик он забирает только наступившие
+напоминания. Забор пачки атомарный (Lua), несколько воркеров делят нагрузку.
+Необработанное напоминание (воркер упал, sink выбросил исключение) после
+окончания аренды возвращается в очередь — доставка «хотя бы один раз».
+
+Воркер:
+    python -m app.core.reminders
+    python -m app.core.reminders --backfill    # один раз для уже существующих задач
+
+Метрики воркера отдаются на собственном порту (REMINDER_METRICS_PORT, 0 — выключено).
+"""
+import argparse
+import json
+import os
+import signal
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+import structlog
+from prometheus_client import Counter, Histogram, start_http_server
+
+from .redis_client import redis_client
+
+logger = structlog.get_logger(__name__)
+
+REMINDER_LEAD_SECONDS = int(os.getenv("REMINDER_LEAD_SECONDS", "3600"))
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", "100"))
+REMINDER_LEASE_SECONDS = int(os.getenv("REMINDER_LEASE_SECONDS", "60"))
+REMINDER_POLL_INTERVAL = float(os.getenv("REMINDER_POLL_INTERVAL", "1"))
+REMINDER_SINK = os.getenv("REMINDER_SINK", "log")
+REMINDER_METRICS_PORT = int(os.getenv("REMINDER_METRICS_PORT", "9102"))
+
+DUE_KEY = "reminders:due"
+PROCESSING_KEY = "reminders:processing"
+
+REMINDERS_SENT = Counter('reminders_sent_total', 'Reminders delivered to the sink')
+REMINDERS_SKIPPED = Counter('reminders_skipped_total', 'Claimed reminders not sent', ['reason'])
+REMINDER_LAG = Histogram(
+    'reminder_delivery_lag_seconds', 'Delay between scheduled reminder time and delivery',
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 300)
+)
+
+# KEYS[1] = due, KEYS[2] = processing; ARGV = now, batch, lease
+# Просроченные аренды возвращаются в очередь, затем пачка наступивших
+# напоминаний переносится в processing с новой арендой.
+CLAIM_SCRIPT = """
+local now = tonumber(ARGV[1])
+local batch = tonumber(ARGV[2])
+local lease = tonumber(ARGV[3])
+
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now, 'LIMIT', 0, batch)
+for _, member in ipairs(expired) do
+    redis.call('ZREM', KEYS[2], member)
+    redis.call('ZADD', KEYS[1], 'NX', now, member)
+end
+
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now, 'WITHSCORES', 'LIMIT', 0, batch)
+for i = 1, #due, 2 do
+    redis.call('ZREM', KEYS[1], due[i])
+    redis.call('ZADD', KEYS[2], now + lease, due[i])
+end
+return due
+"""
+
+
+@dataclass
+class Reminder:
+    """Напоминание, передаваемое в sink"""
+    task_id: int
+    owner_id: int
+    title: str
+    due_date: str
+    remind_at: str
+
+
+# ==================== SCHEDULING ====================
+
+def _member(owner_id: int, task_id: int) -> str:
+    return f"{owner_id}:{task_id}"
+
+
+def _parse_member(member) -> Tuple[int, int]:
+    if isinstance(member, bytes):
+        member = member.decode()
+    owner_id, task_id = member.split(":")
+    return int(owner_id), int(task_id)
+
+
+def _timestamp(value: datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def schedule_reminder(task_id: int, owner_id: int, due_date: Optional[datetime], completed: bool = False):
+    """
+    Постановка (перепланирование) напоминания о задаче
+
+    Без срока или для завершённой задачи напоминание снимается.
+    Ошибки Redis не ломают запрос: напоминание будет пропущено.
+    """
+    if due_date is None or completed:
+        cancel_reminder(task_id, owner_id)
+        return
+    member = _member(owner_id, task_id)
+    try:
+        pipe = redis_client.client.pipeline(transaction=True)
+        pipe.zrem(PROCESSING_KEY, member)
+        pipe.zadd(DUE_KEY, {member: _timestamp(due_date) - REMINDER_LEAD_SECONDS})
+        pipe.execute()
+    except Exception as e:
+        logger.warning("reminder_schedule_failed", task_id=task_id, error=str(e))
+
+
+def cancel_reminder(task_id: int, owner_id: int):
+    """Снятие напоминания (задача удалена, завершена или без срока)"""
+    member = _member(owner_id, task_id)
+    try:
+        pipe = redis_client.client.pipeline(transaction=True)
+        pipe.zrem(DUE_KEY, member)
+        pipe.zrem(PROCESSING_KEY, member)
+        pipe.execute()
+    except Exception as e:
+        logger.warning("reminder_cancel_failed", task_id=task_id, error=str(e))
+
+
+# ==================== SINKS ====================
+
+class LogSink:
+    """Напоминания в лог приложения"""
+
+    def send(self, reminder: Reminder):
+        logger.info("task_reminder", **asdict(reminder))
+
+
+class FileSink:
+    """Напоминания в файл, по одному JSON на строку (для тестов и отладки)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, reminder: Reminder):
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(asdict(reminder)) + "\n")
+
+
+# Фабрики sink'ов по схеме REMINDER_SINK: "log" или "file:/path/to/reminders.jsonl"
+SINKS: Dict[str, Callable[[str], object]] = {
+    "log": lambda arg: LogSink(),
+    "file": lambda arg: FileSink(arg or "reminders.jsonl"),
+}
+
+
+def create_sink(spec: str = REMINDER_SINK):
+    name, _, arg = spec.partition(":")
+    try:
+        return SINKS[name](arg)
+    except KeyError:
+        raise ValueError(f"Unknown reminder sink '{name}'")
+
+
+# ==================== WORKER ====================
+
+class ReminderWorker:
+    """Забирает наступившие напоминания пачками и отправляет их в sink"""
+
+    def __init__(self, sink=None, batch_size: int = REMINDER_BATCH_SIZE,
+                 lease_seconds: int = REMINDER_LEASE_SECONDS):
+        self.sink = sink or create_sink()
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self._claim = redis_client.client.register_script(CLAIM_SCRIPT)
+        self._stop = threading.Event()
+
+    def claim(self) -> List[Tuple[int, int, float]]:
+        """Атомарный забор пачки: [(owner_id, task_id, remind_at)]"""
+        raw = self._claim(keys=[DUE_KEY, PROCESSING_KEY],
+                          args=[time.time(), self.batch_size, self.lease_seconds])
+        claimed = []
+        for index in range(0, len(raw), 2):
+            owner_id, task_id = _parse_member(raw[index])
+            claimed.append((owner_id, task_id, float(raw[index + 1])))
+        return claimed
+
+    def _load_tasks(self, claimed: List[Tuple[int, int, float]]) -> Dict[int, object]:
+        """Актуальные данные задач (по одному запросу на шард)"""
+        from sqlalchemy import select
+        from .sharding import shard_router
+        from ..models.models import Task
+
+        by_shard: Dict[int, List[int]] = {}
+        for owner_id, task_id, _ in claimed:
+            by_shard.setdefault(shard_router.shard_for(owner_id), []).append(task_id)
+
+        tasks = {}
+        for shard, task_ids in by_shard.items():
+            with shard_router.session_for_shard(shard) as session:
+                rows = session.execute(
+                    select(Task.id, Task.owner_id, Task.title, Task.due_date, Task.completed)
+                    .where(Task.id.in_(task_ids))
+                ).all()
+            tasks.update({row.id: row for row in rows})
+        return tasks
+
+    def process_batch(self) -> int:
+        """Один тик: забор, проверка по БД, отправка, подтверждение"""
+        claimed = self.claim()
+        if not claimed:
+            return 0
+
+        tasks = self._load_tasks(claimed)
+        done = []
+        for owner_id, task_id, remind_at in claimed:
+            member = _member(owner_id, task_id)
+            task = tasks.get(task_id)
+            if task is None or task.owner_id != owner_id:
+                REMINDERS_SKIPPED.labels(reason="deleted").inc()
+            elif task.completed or task.due_date is None:
+                REMINDERS_SKIPPED.labels(reason="completed").inc()
+            elif _timestamp(task.due_date) - REMINDER_LEAD_SECONDS > time.time() + 1:
+                # Срок перенесён на будущее, новое напоминание уже в очереди
+                REMINDERS_SKIPPED.labels(reason="rescheduled").inc()
+            else:
+                try:
+                    self.sink.send(Reminder(
+                        task_id=task_id,
+                        owner_id=owner_id,
+                        title=task.title,
+                        due_date=task.due_date.isoformat(),
+                        remind_at=datetime.fromtimestamp(remind_at, timezone.utc).isoformat(),
+                    ))
+                except Exception as e:
+                    # Останется в processing и вернётся в очередь после аренды
+                    logger.error("reminder_send_failed", task_id=task_id, error=str(e))
+                    continue
+                REMINDERS_SENT.inc()
+                REMINDER_LAG.observe(max(0.0, time.time() - remind_at))
+            done.append(member)
+
+        if done:
+            redis_client.client.zrem(PROCESSING_KEY, *done)
+        return len(claimed)
+
+    def run(self, poll_interval: float = REMINDER_POLL_INTERVAL):
+        logger.info("reminder_worker_started", batch_size=self.batch_size, sink=type(self.sink).__name__)
+        while not self._stop.is_set():
+            try:
+                processed = self.process_batch()
+            except Exception as e:
+                logger.error("reminder_batch_failed", error=str(e))
+                processed = 0
+            # Полная пачка — вероятно, есть ещё; иначе ждём следующего тика
+            if processed < self.batch_size:
+                self._stop.wait(poll_interval)
+        logger.info("reminder_worker_stopped")
+
+    def stop(self):
+        self._stop.set()
+
+
+def backfill(batch_size: int = 1000) -> int:
+    """Постановка напоминаний для существующих незавершённых задач со сроком в будущем"""
+    from sqlalchemy import select
+    from .sharding import shard_router
+    from ..models.models import Task
+
+    scheduled = 0
+    now = datetime.now(timezone.utc)
+    for shard in sorted(shard_router.engines):
+        last_id = 0
+        while True:
+            with shard_router.session_for_shard(shard) as session:
+                rows = session.execute(
+                    select(Task.id, Task.owner_id, Task.due_date)
+                    .where(Task.id > last_id, Task.completed.is_(False),
+                           Task.due_date.is_not(None), Task.due_date > now)
+                    .order_by(Task.id).limit(batch_size)
+                ).all()
+            if not rows:
+                break
+            redis_client.client.zadd(DUE_KEY, {
+                _member(row.owner_id, row.id): _timestamp(row.due_date) - REMINDER_LEAD_SECONDS
+                for row in rows
+            })
+            scheduled += len(rows)
+            last_id = rows[-1].id
+    logger.info("reminders_backfilled", count=scheduled)
+    return scheduled
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Task due-date reminder worker")
+    parser.add_argument("--sink", default=REMINDER_SINK, help="log или file:/path/to/file.jsonl")
+    parser.add_argument("--batch-size", type=int, default=REMINDER_BATCH_SIZE)
+    parser.add_argument("--poll-interval", type=float, default=REMINDER_POLL_INTERVAL)
+    parser.add_argument("--backfill", action="store_true", help="поставить напоминания для существующих задач и выйти")
+    parser.add_argument("--metrics-port", type=int, default=REMINDER_METRICS_PORT,
+                        help="порт /metrics (0 — не запускать)")
+    args = parser.parse_args()
+
+    from .log_pipeline import configure_logging, shutdown_logging
+    from .vault import vault_client
+    configure_logging(level=vault_client.get_monitoring_config()["log_level"])
+
+    try:
+        if args.backfill:
+            backfill()
+            return
+
+        if args.metrics_port:
+            start_http_server(args.metrics_port)
+            logger.info("reminder_metrics_started", port=args.metrics_port)
+
+        worker = ReminderWorker(create_sink(args.sink), batch_size=args.batch_size)
+        signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+        signal.signal(signal.SIGINT, lambda *_: worker.stop())
+        worker.run(args.poll_interval)
+    finally:
+        shutdown_logging()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Token Revocation Module
+Отзыв access-токенов (logout) без обращения к Redis на каждый запрос
+
+Источник истины — Redis:
+    revoked:<jti>     ключ с TTL до истечения токена
+    revoked:index     sorted set jti -> exp (для пересборки фильтров)
+    revoked:events    канал pub/sub с новыми отзывами
+
+Каждый воркер держит в памяти фильтр Блума отозванных jti. Если фильтр
+говорит «нет» (обычный случай), токен не отозван и Redis не опрашивается.
+Если «возможно» — отзыв подтверждается ключом в Redis. Фильтр обновляется по
+pub/sub и периодически пересобирается из revoked:index, чтобы выбросить
+истёкшие токены (из фильтра Блума нельзя удалять).
+
+Отзыв на других подах вступает в силу с задержкой доставки pub/sub
+(метрика token_revocation_sync_lag_seconds).
+
+Фильтр собирается синхронно в start() (до приёма запросов). Пока первая
+сборка не удалась, каждый токен проверяется ключом в Redis.
+
+Токены отзывает POST /api/auth/logout (app/main.py).
+"""
+import base64
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from typing import Optional, Tuple
+
+import structlog
+from prometheus_client import Counter, Gauge, Histogram
+
+from .redis_client import redis_client
+
+logger = structlog.get_logger(__name__)
+
+REVOCATION_ENABLED = os.getenv("REVOCATION_ENABLED", "true").lower() == "true"
+BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "100000"))
+BLOOM_FP_RATE = float(os.getenv("REVOCATION_BLOOM_FP_RATE", "0.001"))
+REBUILD_INTERVAL = float(os.getenv("REVOCATION_REBUILD_INTERVAL", "300"))
+# TTL отзыва для токенов без exp
+DEFAULT_TOKEN_TTL = int(os.getenv("REVOCATION_DEFAULT_TTL", "3600"))
+
+KEY_PREFIX = "revoked:"
+INDEX_KEY = "revoked:index"
+CHANNEL = "revoked:events"
+
+REVOCATION_CHECKS = Counter(
+    'token_revocation_checks_total',
+    'Token revocation checks (false_positive = Bloom filter hit not confirmed by Redis, '
+    'not_ready = checked in Redis before the first filter build)',
+    ['result']
+)
+REVOCATION_SYNC_LAG = Histogram(
+    'token_revocation_sync_lag_seconds', 'Delay between revocation and its arrival via pub/sub',
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+BLOOM_ENTRIES = Gauge('token_revocation_bloom_entries', 'Revoked tokens in the Bloom filter',
+                      multiprocess_mode='max')
+BLOOM_EXPECTED_FP_RATE = Gauge('token_revocation_bloom_expected_fp_rate',
+                               'Expected Bloom filter false positive rate', multiprocess_mode='max')
+LAST_REBUILD = Gauge('token_revocation_last_rebuild_timestamp_seconds',
+                     'Time of the last full Bloom filter rebuild', multiprocess_mode='min')
+
+
+class BloomFilter:
+    """Фильтр Блума на bytearray (двойное хеширование blake2b)"""
+
+    def __init__(self, capacity: int = BLOOM_CAPACITY, fp_rate: float = BLOOM_FP_RATE):
+        self.size = max(8, int(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def expected_fp_rate(self) -> float:
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+
+def token_claims(token: str) -> Tuple[str, Optional[int]]:
+    """
+    Идентификатор и время истечения токена
+
+    Подпись здесь не проверяется: это делает аутентификация, а отзыв
+    поддельного токена ни на что не влияет. Для токенов без jti
+    идентификатором служит хэш токена.
+    """
+    jti, exp = None, None
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        jti, exp = claims.get("jti"), claims.get("exp")
+    except (IndexError, ValueError, AttributeError):
+        pass
+    if not jti:
+        jti = hashlib.sha256(token.encode()).hexdigest()[:32]
+    return str(jti), int(exp) if exp else None
+
+
+class RevocationList:
+    """Список отозванных токенов: Redis + локальный фильтр Блума"""
+
+    def __init__(self):
+        self._bloom = BloomFilter()
+        self._lock = threading.Lock()
+        # jti, полученные во время пересборки (чтобы не потерять их при замене фильтра)
+        self._rebuild_buffer: Optional[list] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        # Фильтр собран хотя бы раз; до этого пустой фильтр ничего не говорит
+        self._ready = False
+
+    # ==================== FILTER ====================
+
+    def _add_local(self, jti: str):
+        with self._lock:
+            self._bloom.add(jti)
+            if self._rebuild_buffer is not None:
+                self._rebuild_buffer.append(jti)
+            BLOOM_ENTRIES.set(self._bloom.count)
+            BLOOM_EXPECTED_FP_RATE.set(self._bloom.expected_fp_rate())
+
+    def rebuild(self):
+        """Пересборка фильтра из revoked:index (истёкшие токены выбрасываются)"""
+        with self._lock:
+            self._rebuild_buffer = []
+        try:
+            client = redis_client.client
+            now = time.time()
+            client.zremrangebyscore(INDEX_KEY, "-inf", now)
+            members = client.zrangebyscore(INDEX_KEY, now, "+inf")
+
+            bloom = BloomFilter(max(BLOOM_CAPACITY, len(members) * 2), BLOOM_FP_RATE)
+            for member in members:
+                bloom.add(member.decode() if isinstance(member, bytes) else member)
+        except Exception:
+            with self._lock:
+                self._rebuild_buffer = None
+            raise
+
+        with self._lock:
+            for jti in self._rebuild_buffer:
+                bloom.add(jti)
+            self._rebuild_buffer = None
+            self._bloom = bloom
+            self._ready = True
+            BLOOM_ENTRIES.set(bloom.count)
+            BLOOM_EXPECTED_FP_RATE.set(bloom.expected_fp_rate())
+        LAST_REBUILD.set(time.time())
+        logger.info("revocation_filter_rebuilt", entries=bloom.count)
+
+    # ==================== REVOKE / CHECK ====================
+
+    def revoke(self, token: str):
+        """Отзыв токена (POST /api/auth/logout)"""
+        jti, exp = token_claims(token)
+        now = time.time()
+        ttl = max(1, int(exp - now)) if exp else DEFAULT_TOKEN_TTL
+
+        client = redis_client.client
+        pipe = client.pipeline(transaction=False)
+        pipe.set(f"{KEY_PREFIX}{jti}", 1, ex=ttl)
+        pipe.zadd(INDEX_KEY, {jti: now + ttl})
+        pipe.publish(CHANNEL, f"{jti}|{now}")
+        pipe.execute()
+
+        self._add_local(jti)
+        logger.info("token_revoked", jti=jti, ttl=ttl)
+
+    def is_revoked(self, token: str) -> bool:
+        if not REVOCATION_ENABLED:
+            return False
+        jti, _ = token_claims(token)
+        if self._ready and jti not in self._bloom:
+            REVOCATION_CHECKS.labels(result="not_revoked").inc()
+            return False
+
+        try:
+            revoked = bool(redis_client.client.exists(f"{KEY_PREFIX}{jti}"))
+        except Exception as e:
+            # Фильтр сказал «возможно», подтвердить нельзя — отказываем
+            logger.warning("revocation_check_failed", error=str(e))
+            REVOCATION_CHECKS.labels(result="unconfirmed").inc()
+            return True
+
+        if not self._ready:
+            result = "revoked" if revoked else "not_ready"
+        else:
+            result = "revoked" if revoked else "false_positive"
+        REVOCATION_CHECKS.labels(result=result).inc()
+        return revoked
+
+    # ==================== SYNC ====================
+
+    def _handle_event(self, data):
+        if isinstance(data, bytes):
+            data = data.decode()
+        jti, _, published_at = data.partition("|")
+        self._add_local(jti)
+        try:
+            REVOCATION_SYNC_LAG.observe(max(0.0, time.time() - float(published_at)))
+        except ValueError:
+            pass
+
+    def _run(self):
+        last_rebuild = 0.0
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                pubsub = redis_client.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                # После (пере)подключения события могли быть пропущены
+                self.rebuild()
+                last_rebuild = time.monotonic()
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message["type"] == "message":
+                        self._handle_event(message["data"])
+                    if time.monotonic() - last_rebuild >= REBUILD_INTERVAL:
+                        self.rebuild()
+                        last_rebuild = time.monotonic()
+            except Exception as e:
+                logger.warning("revocation_sync_failed", error=str(e))
+                self._stop.wait(5)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def start(self):
+        """Первая сборка фильтра (синхронно, при старте) и фоновая синхронизация"""
+        if REVOCATION_ENABLED and self._thread is None:
+            try:
+                self.rebuild()
+            except Exception as e:
+                # Фоновый поток повторит сборку; до неё проверки идут в Redis
+                logger.warning("revocation_initial_rebuild_failed", error=str(e))
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="revocation-sync", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+revocation_list = RevocationList()
+
+
+def bearer_token(authorization: Optional[str]) -> Optional[str]:
+    """Токен из заголовка Authorization: Bearer <token>"""
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return token.strip()
@@ -0,0 +1,181 @@
+"""
+Schema Extensions Module
+Идемпотентные изменения схемы поверх init_db() (колонки и индексы,
+которые create_all не добавляет в уже существующие таблицы)
+"""
+import time
+from contextlib import contextmanager
+
+import structlog
+from sqlalchemy import column, table, text
+
+from .archive import ensure_archive_table
+from .database import engine
+from ..models.models import Task
+
+logger = structlog.get_logger(__name__)
+
+TASKS_TABLE = Task.__tablename__
+ARCHIVE_TABLE = f"{TASKS_TABLE}_archive"
+TAG_COUNTS_TABLE = "task_tag_counts"
+
+# Счётчики задач по тегам (для запросов)
+tag_counts_table = table(TAG_COUNTS_TABLE, column("owner_id"), column("tag"), column("count"))
+
+# Ключ pg_advisory_lock: DDL при одновременном старте подов выполняется по очереди
+SCHEMA_LOCK_KEY = 7_203_115
+SCHEMA_LOCK_POLL_INTERVAL = 0.5
+
+# Индексы горячей таблицы строятся CONCURRENTLY, без блокировки записи: (имя, определение)
+CONCURRENT_INDEXES = [
+    # Частичный индекс для поиска кандидатов на архивацию
+    (f"ix_{TASKS_TABLE}_archivable", f"ON {TASKS_TABLE} (completed_at) WHERE completed"),
+    # Фильтры tags && :tags (любой) и tags @> :tags (все)
+    (f"ix_{TASKS_TABLE}_tags", f"ON {TASKS_TABLE} USING GIN (tags)"),
+    # Инкрементальное обновление аналитики: updated_at >= :since ORDER BY updated_at, id
+    (f"ix_{TASKS_TABLE}_updated_id", f"ON {TASKS_TABLE} (updated_at, id)"),
+]
+
+
+def tables_missing_column(conn, column_name: str, tables=(TASKS_TABLE, ARCHIVE_TABLE)):
+    """
+    Существующие таблицы из tables без колонки column_name
+
+    ALTER TABLE ... ADD COLUMN IF NOT EXISTS берёт ACCESS EXCLUSIVE даже когда
+    колонка уже есть, поэтому при каждом старте сначала проверяется каталог.
+    """
+    present = conn.execute(text("""
+        SELECT table_name, bool_or(column_name = :column)
+        FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name::text = ANY(:tables)
+        GROUP BY table_name
+    """), {"column": column_name, "tables": list(tables)}).all()
+    return [table_name for table_name, has_column in present if not has_column]
+
+
+def ensure_task_version(conn):
+    """Колонка version для оптимистичной блокировки (If-Match / 409)"""
+    for table_name in tables_missing_column(conn, "version"):
+        conn.execute(text(f"""
+            ALTER TABLE {table_name}
+            ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1
+        """))
+
+
+def ensure_task_tags(conn):
+    """
+    Колонка tags (text[]) и счётчики задач по тегам (GIN-индекс — в CONCURRENT_INDEXES)
+
+    Счётчики task_tag_counts поддерживаются триггерами, поэтому статистика
+    по тегам не пересчитывает все задачи пользователя.
+    """
+    for table_name in tables_missing_column(conn, "tags"):
+        conn.execute(text(f"""
+            ALTER TABLE {table_name}
+            ADD COLUMN IF NOT EXISTS tags TEXT[] NOT NULL DEFAULT '{{}}'
+        """))
+    created = conn.execute(text("SELECT to_regclass(:name)"), {"name": TAG_COUNTS_TABLE}).scalar() is None
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {TAG_COUNTS_TABLE} (
+            owner_id INTEGER NOT NULL,
+            tag TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (owner_id, tag)
+        )
+    """))
+    if created:
+        conn.execute(text(f"""
+            INSERT INTO {TAG_COUNTS_TABLE} (owner_id, tag, count)
+            SELECT owner_id, tag, count(*)
+            FROM {TASKS_TABLE}, unnest(tags) AS tag
+            GROUP BY owner_id, tag
+        """))
+
+    conn.execute(text(f"""
+        CREATE OR REPLACE FUNCTION {TAG_COUNTS_TABLE}_sync() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') AND cardinality(OLD.tags) > 0 THEN
+                UPDATE {TAG_COUNTS_TABLE} AS c SET count = c.count - 1
+                FROM (SELECT DISTINCT unnest(OLD.tags) AS tag) AS t
+                WHERE c.owner_id = OLD.owner_id AND c.tag = t.tag;
+                DELETE FROM {TAG_COUNTS_TABLE}
+                WHERE owner_id = OLD.owner_id AND tag = ANY(OLD.tags) AND count <= 0;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND cardinality(NEW.tags) > 0 THEN
+                INSERT INTO {TAG_COUNTS_TABLE} (owner_id, tag, count)
+                SELECT NEW.owner_id, t.tag, 1 FROM (SELECT DISTINCT unnest(NEW.tags) AS tag) AS t
+                ON CONFLICT (owner_id, tag) DO UPDATE SET count = {TAG_COUNTS_TABLE}.count + 1;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """))
+    # CREATE/DROP TRIGGER блокирует запись в tasks, поэтому триггеры создаются
+    # только если их ещё нет (тело функции обновляет CREATE OR REPLACE выше)
+    existing = set(conn.execute(text("""
+        SELECT tgname FROM pg_trigger
+        WHERE tgrelid = CAST(:table AS regclass) AND NOT tgisinternal
+    """), {"table": TASKS_TABLE}).scalars())
+    if f"{TAG_COUNTS_TABLE}_insert_delete" not in existing:
+        conn.execute(text(f"""
+            CREATE TRIGGER {TAG_COUNTS_TABLE}_insert_delete
+            AFTER INSERT OR DELETE ON {TASKS_TABLE}
+            FOR EACH ROW EXECUTE FUNCTION {TAG_COUNTS_TABLE}_sync()
+        """))
+    if f"{TAG_COUNTS_TABLE}_update" not in existing:
+        conn.execute(text(f"""
+            CREATE TRIGGER {TAG_COUNTS_TABLE}_update
+            AFTER UPDATE OF tags, owner_id ON {TASKS_TABLE}
+            FOR EACH ROW
+            WHEN (OLD.tags IS DISTINCT FROM NEW.tags OR OLD.owner_id IS DISTINCT FROM NEW.owner_id)
+            EXECUTE FUNCTION {TAG_COUNTS_TABLE}_sync()
+        """))
+
+
+def ensure_index_concurrently(conn, name: str, definition: str):
+    """
+    CREATE INDEX CONCURRENTLY (conn — в режиме AUTOCOMMIT)
+
+    Невалидный индекс, оставшийся от прерванной сборки, пересоздаётся:
+    IF NOT EXISTS сам по себе его бы пропустил.
+    """
+    valid = conn.execute(
+        text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"), {"name": name}
+    ).scalar()
+    if valid:
+        return
+    if valid is False:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}"))
+    logger.info("index_created", index=name)
+
+
+@contextmanager
+def schema_lock(bind):
+    """
+    Сессионная advisory-блокировка DDL на базе bind; отдаёт AUTOCOMMIT-соединение
+
+    Ожидание через pg_try_advisory_lock, а не блокирующий pg_advisory_lock:
+    ждущий под не держит открытую транзакцию, которую CREATE INDEX
+    CONCURRENTLY другого пода ждал бы (взаимная блокировка).
+    """
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+        while not lock_conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": SCHEMA_LOCK_KEY}).scalar():
+            time.sleep(SCHEMA_LOCK_POLL_INTERVAL)
+        try:
+            yield lock_conn
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": SCHEMA_LOCK_KEY})
+
+
+def apply_schema_extensions(bind=None):
+    """Применение всех расширений схемы (вызывается при старте после init_db и для каждого шарда)"""
+    bind = bind or engine
+    with schema_lock(bind) as lock_conn:
+        with bind.begin() as conn:
+            ensure_task_version(conn)
+            ensure_task_tags(conn)
+            ensure_archive_table(conn)
+        for name, definition in CONCURRENT_INDEXES:
+            ensure_index_concurrently(lock_conn, name, definition)
+    logger.info("schema_extensions_applied")
@@ -0,0 +1,46 @@
+"""
+Serialization Module
+Быстрая сериализация задач без ORM и Pydantic: выборка только нужных
+колонок кортежами и прямое кодирование в JSON
+"""
+import json
+from typing import Iterable, List, Optional, Sequence
+
+from fastapi import HTTPException
+from pydantic_core import to_jsonable_python
+
+from ..schemas.schemas import TaskResponse
+
+# Поля ответа в порядке схемы TaskResponse
+TASK_FIELDS: List[str] = list(TaskResponse.model_fields)
+
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """
+    Разбор параметра ?fields=id,title,status
+
+    Returns:
+        Список полей в порядке схемы (все поля, если параметр не задан)
+    """
+    if not fields:
+        return TASK_FIELDS
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested.difference(TASK_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return [name for name in TASK_FIELDS if name in requested]
+
+
+def _json_default(value):
+    # Тот же формат, что у Pydantic в ответах с response_model
+    # (например, datetime в UTC — "...Z", а не "+00:00")
+    return to_jsonable_python(value)
+
+
+def encode_rows(fields: Sequence[str], rows: Iterable[Sequence]) -> str:
+    """Кодирование строк-кортежей в JSON-массив объектов"""
+    return json.dumps(
+        [dict(zip(fields, row)) for row in rows],
+        default=_json_default,
+        separators=(",", ":"),
+    )
@@ -0,0 +1,349 @@
+"""
+Shard Rebalance Tool
+Онлайн-перенос задач пользователя на другой шард
+
+    python -m app.core.shard_rebalance --user 42 --to 2
+    python -m app.core.shard_rebalance --pin-for-hash-shards 3
+    python -m app.core.shard_rebalance --migrate-bigint-ids
+
+Этапы:
+1. копирование всех задач без остановки записи;
+2. каталог переводится в moving:<откуда>:<куда> — поды отвечают 503 на запись,
+   чтение продолжается со старого шарда;
+3. повторное копирование всех задач (запись остановлена, поэтому результат точный),
+   удаление лишних, перенос архива, сверка количества и версий строк;
+4. каталог указывает на новый шард;
+5. после истечения локальных кэшей каталога задачи удаляются со старого шарда.
+
+При ошибке на этапах 1–3 каталог возвращается на старый шард, а скопированные
+горячие и архивные задачи удаляются с нового.
+
+Архивация на обоих шардах приостановлена до конца этапа 3 (удерживается
+advisory-блокировка архиватора), иначе задачи могли бы уйти в архив между
+копированием и сверкой.
+
+--pin-for-hash-shards N закрепляет в каталоге текущий шард пользователей,
+у которых owner_id % N даст другой шард; после этого hash_shards можно поднять до N.
+
+--migrate-bigint-ids переводит tasks.id на BIGINT на всех шардах карты. Это
+обязательный шаг перед включением шардирования (поды без него не стартуют);
+ALTER COLUMN TYPE переписывает таблицу под ACCESS EXCLUSIVE — окно обслуживания.
+"""
+import argparse
+import time
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+import structlog
+from sqlalchemy import delete, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Engine
+
+from .archive import ARCHIVE_LOCK_KEY, ARCHIVE_TABLE, archive_table, ensure_archive_table, ensure_partitions
+from .redis_client import redis_client
+from .schema import schema_lock
+from .sharding import (
+    DIRECTORY_CACHE_TTL, DIRECTORY_KEY, MOVING_PREFIX, narrow_task_id_columns, shard_router, task_id_sequence,
+)
+from ..models.models import Task, User
+
+logger = structlog.get_logger(__name__)
+
+tasks_table = Task.__table__
+
+
+def _copy_tasks(source: Engine, target: Engine, owner_id: int, batch_size: int) -> int:
+    """Копирование (upsert по id) задач пользователя пачками по возрастанию id"""
+    columns = [c.name for c in tasks_table.columns]
+    copied = 0
+    last_id = 0
+    while True:
+        query = select(tasks_table).where(
+            tasks_table.c.owner_id == owner_id,
+            tasks_table.c.id > last_id
+        ).order_by(tasks_table.c.id).limit(batch_size)
+
+        with source.connect() as conn:
+            rows = [dict(row) for row in conn.execute(query).mappings()]
+        if not rows:
+            return copied
+
+        stmt = pg_insert(tasks_table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[tasks_table.c.id],
+            set_={name: stmt.excluded[name] for name in columns if name != "id"}
+        )
+        with target.begin() as conn:
+            conn.execute(stmt)
+
+        copied += len(rows)
+        last_id = rows[-1]["id"]
+
+
+def _remove_deleted(source: Engine, target: Engine, owner_id: int) -> int:
+    """Удаление на новом шарде задач, удалённых на старом во время копирования"""
+    query = select(tasks_table.c.id).where(tasks_table.c.owner_id == owner_id)
+    with source.connect() as conn:
+        source_ids = set(conn.execute(query).scalars())
+    with target.connect() as conn:
+        stale = [task_id for task_id in conn.execute(query).scalars() if task_id not in source_ids]
+    if stale:
+        with target.begin() as conn:
+            conn.execute(delete(tasks_table).where(tasks_table.c.id.in_(stale)))
+    return len(stale)
+
+
+def _move_archive(source: Engine, target: Engine, owner_id: int) -> int:
+    """
+    Перенос архивных задач пользователя (повторный запуск безопасен)
+
+    На новый шард вставляются только строки, которых там ещё нет: уже
+    лежащие там архивные задачи пользователя не удаляются.
+    """
+    with source.begin() as conn:
+        ensure_archive_table(conn)
+        rows = [dict(row) for row in conn.execute(
+            select(archive_table).where(archive_table.c.owner_id == owner_id)
+        ).mappings()]
+    if not rows:
+        return 0
+
+    columns = list(rows[0])
+    with target.begin() as conn:
+        ensure_archive_table(conn)
+        present = set(conn.execute(
+            select(archive_table.c.id).where(archive_table.c.owner_id == owner_id)
+        ).scalars())
+        missing = [row for row in rows if row["id"] not in present]
+        if missing:
+            completed = [row["completed_at"] for row in missing]
+            ensure_partitions(conn, min(completed).date(), max(completed).date())
+            conn.execute(
+                text(f"INSERT INTO {ARCHIVE_TABLE} ({', '.join(columns)}) "
+                     f"VALUES ({', '.join(':' + name for name in columns)})"),
+                missing
+            )
+    return len(missing)
+
+
+def _fingerprint(engine: Engine, owner_id: int) -> Tuple[int, Optional[str], int]:
+    """Количество задач, хэш (id, version) и количество архивных задач пользователя"""
+    with engine.connect() as conn:
+        count, digest = conn.execute(text(f"""
+            SELECT count(*), md5(string_agg(id::text || ':' || version::text, ',' ORDER BY id))
+            FROM {tasks_table.name} WHERE owner_id = :owner_id
+        """), {"owner_id": owner_id}).one()
+        archived = conn.execute(
+            text(f"SELECT count(*) FROM {ARCHIVE_TABLE} WHERE owner_id = :owner_id"), {"owner_id": owner_id}
+        ).scalar()
+    return count, digest, archived
+
+
+@contextmanager
+def _archiving_paused(*engines: Engine):
+    """Удержание блокировки архиватора на шардах (ждёт завершения текущего прохода)"""
+    connections = []
+    try:
+        for engine in engines:
+            conn = engine.connect()
+            connections.append(conn)
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": ARCHIVE_LOCK_KEY})
+            conn.commit()
+        yield
+    finally:
+        for conn in connections:
+            try:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ARCHIVE_LOCK_KEY})
+                conn.commit()
+            finally:
+                conn.close()
+
+
+def _delete_user_tasks(engine: Engine, owner_id: int, batch_size: int) -> int:
+    """Удаление задач пользователя (горячих пачками и архивных) с шарда"""
+    deleted = 0
+    while True:
+        with engine.begin() as conn:
+            count = conn.execute(text(f"""
+                DELETE FROM {tasks_table.name} WHERE id IN (
+                    SELECT id FROM {tasks_table.name} WHERE owner_id = :owner_id LIMIT :batch_size
+                )
+            """), {"owner_id": owner_id, "batch_size": batch_size}).rowcount
+        deleted += count
+        if count < batch_size:
+            break
+    with engine.begin() as conn:
+        ensure_archive_table(conn)
+        deleted += conn.execute(
+            text(f"DELETE FROM {ARCHIVE_TABLE} WHERE owner_id = :owner_id"), {"owner_id": owner_id}
+        ).rowcount
+    return deleted
+
+
+def move_user(owner_id: int, target_shard: int, batch_size: int = 1000,
+              settle_seconds: Optional[float] = None) -> dict:
+    """
+    Перенос задач пользователя на шард target_shard
+
+    Args:
+        owner_id: id пользователя
+        target_shard: номер шарда назначения
+        batch_size: размер пачки копирования и удаления
+        settle_seconds: ожидание, пока все поды увидят новое состояние каталога
+    """
+    settle = settle_seconds if settle_seconds is not None else DIRECTORY_CACHE_TTL + 5
+    redis = redis_client.client
+
+    shard_router.invalidate(owner_id)
+    source_shard, moving = shard_router.resolve(owner_id)
+    if moving:
+        raise RuntimeError(f"user {owner_id} is already being moved")
+    if source_shard == target_shard:
+        return {"owner_id": owner_id, "shard": source_shard, "moved": False}
+
+    source = shard_router.engine_for_shard(source_shard)
+    target = shard_router.engine_for_shard(target_shard)
+    logger.info("shard_move_started", owner_id=owner_id, source=source_shard, target=target_shard)
+
+    with _archiving_paused(source, target):
+        try:
+            # 1. Копирование без остановки записи
+            copied = _copy_tasks(source, target, owner_id, batch_size)
+
+            # 2. Остановка записи
+            redis.hset(DIRECTORY_KEY, owner_id, f"{MOVING_PREFIX}{source_shard}:{target_shard}")
+            time.sleep(settle)
+
+            # 3. Повторное копирование при остановленной записи, архив, сверка
+            recopied = _copy_tasks(source, target, owner_id, batch_size)
+            removed = _remove_deleted(source, target, owner_id)
+            archived = _move_archive(source, target, owner_id)
+            expected, actual = _fingerprint(source, owner_id), _fingerprint(target, owner_id)
+            if expected != actual:
+                raise RuntimeError(f"shard copy mismatch for user {owner_id}: "
+                                   f"source={expected}, target={actual}")
+        except Exception:
+            # Откат: пользователь остаётся на старом шарде, скопированное удаляется
+            # с нового — иначе статистика по шардам, счётчики тегов и аналитика
+            # учли бы его задачи дважды, а повтор начался бы с грязного шарда
+            redis.hset(DIRECTORY_KEY, owner_id, source_shard)
+            try:
+                purged = _delete_user_tasks(target, owner_id, batch_size)
+            except Exception as e:
+                logger.error("shard_move_rollback_failed", owner_id=owner_id, target=target_shard, error=str(e))
+            else:
+                logger.warning("shard_move_rolled_back", owner_id=owner_id, source=source_shard,
+                               target=target_shard, purged_on_target=purged)
+            raise
+
+    # 4. Переключение
+    redis.hset(DIRECTORY_KEY, owner_id, target_shard)
+    time.sleep(settle)
+
+    # 5. Очистка старого шарда
+    deleted = _delete_user_tasks(source, owner_id, batch_size)
+
+    result = {
+        "owner_id": owner_id,
+        "source": source_shard,
+        "target": target_shard,
+        "copied": copied,
+        "recopied": recopied,
+        "removed_on_target": removed,
+        "archived": archived,
+        "deleted_on_source": deleted,
+        "moved": True,
+    }
+    logger.info("shard_move_finished", **result)
+    return result
+
+
+def pin_for_hash_shards(hash_shards: int, batch_size: int = 1000) -> int:
+    """
+    Закрепление текущего шарда за пользователями перед расширением хэш-пространства
+
+    Пользователи без записи в каталоге, для которых owner_id % hash_shards
+    отличается от текущего шарда, получают явное назначение на текущий шард.
+    """
+    if not 1 <= hash_shards <= len(shard_router.engines):
+        raise ValueError(f"hash_shards must be between 1 and {len(shard_router.engines)}")
+
+    redis = redis_client.client
+    pinned = 0
+    last_id = 0
+    while True:
+        with shard_router.session_for_shard(0) as session:
+            user_ids = session.execute(
+                select(User.id).where(User.id > last_id).order_by(User.id).limit(batch_size)
+            ).scalars().all()
+        if not user_ids:
+            break
+        entries = redis.hmget(DIRECTORY_KEY, user_ids)
+        pins = {}
+        for user_id, entry in zip(user_ids, entries):
+            current = shard_router.hash_shard(user_id)
+            if entry is None and current != user_id % hash_shards:
+                pins[user_id] = current
+        if pins:
+            redis.hset(DIRECTORY_KEY, mapping=pins)
+        pinned += len(pins)
+        last_id = user_ids[-1]
+    logger.info("shard_directory_pinned", hash_shards=hash_shards, pinned=pinned)
+    return pinned
+
+
+def migrate_bigint_ids() -> dict:
+    """
+    Перевод tasks.id, tasks_archive.id и последовательности tasks.id на BIGINT на всех шардах
+
+    Повторный запуск ничего не делает: тип проверяется по каталогу.
+
+    Returns:
+        {номер шарда: список переведённых объектов}
+    """
+    migrated = {}
+    for number, shard_engine in sorted(shard_router.engines.items()):
+        with schema_lock(shard_engine):
+            if number != 0:
+                shard_router.prepare_shard_tables(shard_engine)
+            with shard_engine.begin() as conn:
+                narrow = narrow_task_id_columns(conn)
+                sequence = task_id_sequence(conn)
+                for name in narrow:
+                    if name == sequence:
+                        conn.execute(text(f"ALTER SEQUENCE {sequence} AS BIGINT"))
+                    else:
+                        conn.execute(text(f"ALTER TABLE {name[:-len('.id')]} ALTER COLUMN id TYPE BIGINT"))
+        if narrow:
+            logger.info("task_ids_migrated_to_bigint", shard=number, objects=narrow)
+        migrated[number] = narrow
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move a user's tasks to another shard")
+    parser.add_argument("--user", type=int)
+    parser.add_argument("--to", type=int, dest="target")
+    parser.add_argument("--pin-for-hash-shards", type=int, default=None,
+                        help="закрепить текущие шарды перед увеличением hash_shards")
+    parser.add_argument("--migrate-bigint-ids", action="store_true",
+                        help="перевести tasks.id на BIGINT на всех шардах (до включения шардирования)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--settle-seconds", type=float, default=None)
+    args = parser.parse_args()
+
+    if args.migrate_bigint_ids:
+        print(migrate_bigint_ids())
+        return
+    if args.pin_for_hash_shards is not None:
+        print({"pinned": pin_for_hash_shards(args.pin_for_hash_shards, args.batch_size)})
+        return
+    if args.user is None or args.target is None:
+        parser.error("--user and --to are required")
+
+    result = move_user(args.user, args.target, args.batch_size, args.settle_seconds)
+    print(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""
+Sharding Module
+Распределение задач по нескольким базам PostgreSQL по owner_id
+
+Карта шардов читается из Vault (database/config, ключ 'shards'):
+
+    shards = [
+        {"host": "pg-0", "port": "5432", "database": "taskdb", "username": "taskuser", "password": "..."},
+        {"host": "pg-1", "port": "5432", "database": "taskdb", "username": "taskuser", "password": "..."}
+    ]
+    hash_shards = 1   # сколько шардов участвует в распределении по хэшу (по умолчанию 1)
+
+Шард 0 — основная база (пользователи и прочие общие таблицы). Без ключа 'shards'
+используется одна основная база, как раньше.
+
+Пользователь попадает на шард owner_id % hash_shards, если в каталоге Redis
+(shard:directory) для него нет явного назначения. Явные назначения ставит
+перенос пользователя (app.core.shard_rebalance); новые шарды заполняются только так.
+
+hash_shards по умолчанию 1: добавление шарда в карту не меняет owner_id % hash_shards
+у существующих пользователей. Расширение хэш-пространства — отдельный шаг после
+переноса: сначала закрепить в каталоге текущий шард всех, у кого он сменится,
+
+    python -m app.core.shard_rebalance --pin-for-hash-shards 3
+
+затем поднять hash_shards в Vault. Без закрепления задачи таких пользователей
+«пропадут» до их переноса.
+
+Локальная проверка с несколькими PostgreSQL:
+
+    docker run -d --rm -p 5432:5432 -e POSTGRES_USER=taskuser -e POSTGRES_PASSWORD=pw -e POSTGRES_DB=taskdb postgres:15
+    docker run -d --rm -p 5433:5432 -e POSTGRES_USER=taskuser -e POSTGRES_PASSWORD=pw -e POSTGRES_DB=taskdb postgres:15
+    vault kv patch secret/task-manager/database/config \\
+        shards='[{"host":"localhost","port":"5432",...},{"host":"localhost","port":"5433",...}]'
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Generator, List, Optional, Tuple, TypeVar
+
+import structlog
+from fastapi import Depends, HTTPException
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection, Engine, URL
+from sqlalchemy.orm import Session, sessionmaker
+
+from .database import engine as primary_engine
+from .redis_client import redis_client
+from .security import get_current_user
+from .vault import vault_client
+from ..models.models import Task, User
+
+logger = structlog.get_logger(__name__)
+
+T = TypeVar("T")
+
+DIRECTORY_KEY = "shard:directory"
+DIRECTORY_CACHE_TTL = float(os.getenv("SHARD_DIRECTORY_CACHE_TTL", "30"))
+# Идентификаторы задач на шарде N начинаются с N * ID_RANGE, чтобы не пересекаться
+ID_RANGE = 10 ** 12
+MOVING_PREFIX = "moving:"
+DIRECTORY_CACHE_MAX_SIZE = 100_000
+
+
+def narrow_task_id_columns(conn: Connection) -> List[str]:
+    """
+    Что ещё не переведено на BIGINT: tasks.id, tasks_archive.id, последовательность tasks.id
+
+    Перевод выполняет отдельный шаг (python -m app.core.shard_rebalance --migrate-bigint-ids),
+    а не старт пода: ALTER COLUMN TYPE переписывает таблицу под ACCESS EXCLUSIVE.
+    """
+    narrow = conn.execute(text("""
+        SELECT table_name || '.id' FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name IN (:tasks, :archive)
+          AND column_name = 'id' AND data_type = 'integer'
+    """), {"tasks": Task.__tablename__, "archive": f"{Task.__tablename__}_archive"}).scalars().all()
+    sequence = task_id_sequence(conn)
+    if sequence and conn.execute(text("""
+        SELECT seqtypid = 'integer'::regtype FROM pg_sequence WHERE seqrelid = CAST(:sequence AS regclass)
+    """), {"sequence": sequence}).scalar():
+        narrow.append(sequence)
+    return narrow
+
+
+def task_id_sequence(conn: Connection) -> Optional[str]:
+    return conn.execute(
+        text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": Task.__tablename__}
+    ).scalar()
+
+
+class ShardDirectoryUnavailable(Exception):
+    """Каталог шардов недоступен: шард пользователя определить нельзя"""
+
+
+class ShardRouter:
+    """Выбор движка SQLAlchemy по владельцу задач"""
+
+    def __init__(self):
+        self._engines: Optional[Dict[int, Engine]] = None
+        self._sessions: Dict[int, sessionmaker] = {}
+        self._hash_shards = 1
+        self._directory_cache: Dict[int, Tuple[float, Optional[str]]] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    # ==================== CONFIG ====================
+
+    def _load_config(self):
+        try:
+            config = vault_client.get_secret("database/config")
+        except Exception as e:
+            logger.warning("shard_config_unavailable", error=str(e))
+            config = {}
+
+        shards = config.get("shards") or []
+        if isinstance(shards, str):
+            shards = json.loads(shards)
+
+        engines = {0: primary_engine}
+        for number, shard in enumerate(shards[1:], start=1):
+            url = URL.create(
+                "postgresql+psycopg2",
+                username=shard.get("username", "taskuser"),
+                password=shard.get("password"),
+                host=shard.get("host"),
+                port=int(shard.get("port", 5432)),
+                database=shard.get("database", "taskdb"),
+            )
+            engines[number] = create_engine(
+                url,
+                pool_pre_ping=True,
+                pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+                max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            )
+
+        self._engines = engines
+        self._hash_shards = max(1, min(int(config.get("hash_shards", 1)), len(engines)))
+        logger.info("shard_map_loaded", shards=len(engines), hash_shards=self._hash_shards)
+
+    @property
+    def engines(self) -> Dict[int, Engine]:
+        if self._engines is None:
+            self._load_config()
+        return self._engines
+
+    def engine_for_shard(self, shard: int) -> Engine:
+        try:
+            return self.engines[shard]
+        except KeyError:
+            raise ValueError(f"Unknown shard {shard}")
+
+    def session_for_shard(self, shard: int) -> Session:
+        if shard not in self._sessions:
+            self._sessions[shard] = sessionmaker(bind=self.engine_for_shard(shard), autoflush=False)
+        return self._sessions[shard]()
+
+    def prepare_shard_tables(self, shard_engine: Engine):
+        """
+        Таблица задач на дополнительном шарде
+
+        Пользователи хранятся только на основной базе, поэтому внешний ключ
+        owner_id -> users на дополнительных шардах снимается.
+        """
+        # Таблица users создаётся только ради DDL внешнего ключа и остаётся пустой
+        User.__table__.metadata.create_all(shard_engine, tables=[User.__table__, Task.__table__])
+        with shard_engine.begin() as conn:
+            foreign_keys = conn.execute(text("""
+                SELECT conname FROM pg_constraint
+                WHERE conrelid = CAST(:table AS regclass) AND contype = 'f'
+            """), {"table": Task.__tablename__}).scalars().all()
+            for name in foreign_keys:
+                conn.execute(text(f'ALTER TABLE {Task.__tablename__} DROP CONSTRAINT IF EXISTS "{name}"'))
+
+    def init_shards(self, apply_schema: Callable[[Engine], None]):
+        """
+        Подготовка схемы задач на дополнительных шардах (при старте пода)
+
+        Идентификаторы задач на шардах начинаются с N * ID_RANGE, поэтому
+        шардирование включается, только когда tasks.id на всех шардах, включая
+        основной (туда тоже переносят пользователей), уже BIGINT. DDL выполняется
+        под блокировкой схемы, чтобы поды не делали его одновременно.
+
+        Raises:
+            RuntimeError: на каком-то шарде tasks.id ещё INTEGER
+        """
+        from .schema import schema_lock
+
+        if len(self.engines) == 1:
+            return
+
+        for number, shard_engine in self.engines.items():
+            if number != 0:
+                with schema_lock(shard_engine):
+                    self.prepare_shard_tables(shard_engine)
+
+        for number, shard_engine in self.engines.items():
+            with shard_engine.connect() as conn:
+                narrow = narrow_task_id_columns(conn)
+            if narrow:
+                raise RuntimeError(
+                    f"shard {number}: {', '.join(narrow)} not BIGINT yet; run "
+                    f"'python -m app.core.shard_rebalance --migrate-bigint-ids' before enabling shards"
+                )
+
+        for number, shard_engine in self.engines.items():
+            if number == 0:
+                continue
+            with schema_lock(shard_engine):
+                with shard_engine.begin() as conn:
+                    conn.execute(text(f"""
+                        SELECT setval(
+                            CAST(:sequence AS regclass),
+                            GREATEST((SELECT COALESCE(max(id), 0) FROM {Task.__tablename__}), :floor)
+                        )
+                    """), {"sequence": task_id_sequence(conn), "floor": number * ID_RANGE})
+            apply_schema(shard_engine)
+
+    # ==================== ROUTING ====================
+
+    def _directory_entry(self, owner_id: int) -> Optional[str]:
+        cached = self._directory_cache.get(owner_id)
+        now = time.monotonic()
+        if cached and cached[0] > now:
+            return cached[1]
+
+        try:
+            value = redis_client.client.hget(DIRECTORY_KEY, owner_id)
+        except Exception as e:
+            # Без каталога запрос может уйти на хэш-шард вместо шарда переноса:
+            # отказываем и не кэшируем, следующий запрос спросит Redis снова
+            logger.warning("shard_directory_unavailable", owner_id=owner_id, error=str(e))
+            raise ShardDirectoryUnavailable(str(e)) from e
+        if isinstance(value, bytes):
+            value = value.decode()
+        if len(self._directory_cache) >= DIRECTORY_CACHE_MAX_SIZE:
+            self._directory_cache.clear()
+        self._directory_cache[owner_id] = (now + DIRECTORY_CACHE_TTL, value)
+        return value
+
+    def resolve(self, owner_id: int) -> Tuple[int, bool]:
+        """
+        Шард пользователя
+
+        Returns:
+            (номер шарда, идёт ли перенос пользователя)
+
+        Raises:
+            ShardDirectoryUnavailable: Redis с каталогом недоступен
+        """
+        if len(self.engines) == 1:
+            return 0, False
+
+        entry = self._directory_entry(owner_id)
+        if entry is None:
+            return self.hash_shard(owner_id), False
+        if entry.startswith(MOVING_PREFIX):
+            # moving:<откуда>:<куда> — читаем со старого шарда
+            source = entry[len(MOVING_PREFIX):].split(":")[0]
+            return int(source), True
+        return int(entry), False
+
+    def hash_shard(self, owner_id: int) -> int:
+        """Шард пользователя без явного назначения в каталоге"""
+        if self._engines is None:
+            self._load_config()
+        return owner_id % self._hash_shards
+
+    def shard_for(self, owner_id: int) -> int:
+        return self.resolve(owner_id)[0]
+
+    def invalidate(self, owner_id: Optional[int] = None):
+        """Сброс локального кэша каталога"""
+        if owner_id is None:
+            self._directory_cache.clear()
+        else:
+            self._directory_cache.pop(owner_id, None)
+
+    # ==================== FAN-OUT ====================
+
+    def fan_out(self, fn: Callable[[Session], T]) -> List[T]:
+        """Параллельное выполнение fn на всех шардах"""
+        if len(self.engines) == 1:
+            with self.session_for_shard(0) as session:
+                return [fn(session)]
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=len(self.engines), thread_name_prefix="shard")
+
+        def run(shard: int) -> T:
+            with self.session_for_shard(shard) as session:
+                return fn(session)
+
+        return list(self._executor.map(run, sorted(self.engines)))
+
+
+shard_router = ShardRouter()
+
+
+def get_task_db(current_user: User = Depends(get_current_user)) -> Generator[Session, None, None]:
+    """Зависимость FastAPI: сессия шарда с задачами текущего пользователя"""
+    try:
+        shard, moving = shard_router.resolve(current_user.id)
+    except ShardDirectoryUnavailable:
+        raise HTTPException(
+            status_code=503,
+            detail="Shard directory unavailable, retry shortly",
+            headers={"Retry-After": "1"}
+        )
+    db = shard_router.session_for_shard(shard)
+    db.info["shard"] = shard
+    db.info["moving"] = moving
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def ensure_writable(db: Session):
+    """503 на время переноса пользователя между шардами"""
+    if db.info.get("moving"):
+        raise HTTPException(
+            status_code=503,
+            detail="Tasks are being moved, retry shortly",
+            headers={"Retry-After": str(int(DIRECTORY_CACHE_TTL))}
+        )
@@ -0,0 +1,129 @@
+"""
+SQL Profiler Module
+Профилирование SQL-запросов в рамках одного HTTP-запроса:
+количество запросов, время в БД, медленные запросы и детектор N+1
+"""
+import os
+import re
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import structlog
+from prometheus_client import Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = structlog.get_logger(__name__)
+
+# Prometheus метрики (по шаблону маршрута, а не по фактическому пути)
+DB_QUERIES_PER_REQUEST = Histogram(
+    'db_queries_per_request', 'SQL queries per request', ['method', 'route'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+)
+DB_TIME_PER_REQUEST = Histogram(
+    'db_time_per_request_seconds', 'Time spent in SQL per request', ['method', 'route']
+)
+
+# Пороги
+SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "100"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "5"))
+
+_NUMBER_RE = re.compile(r"\b\d+(\.\d+)?\b")
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_IN_LIST_RE = re.compile(r"\(\s*\?(\s*,\s*\?)+\s*\)")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_sql(statement: str) -> str:
+    """Нормализация SQL: литералы заменяются на '?', пробелы схлопываются"""
+    sql = _STRING_RE.sub("?", statement)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _IN_LIST_RE.sub("(?)", sql)
+    return _WHITESPACE_RE.sub(" ", sql).strip()
+
+
+@dataclass
+class RequestQueryStats:
+    """Статистика SQL-запросов одного HTTP-запроса"""
+    query_count: int = 0
+    total_time: float = 0.0
+    # Сколько раз выполнялось каждое выражение (для детектора N+1)
+    statements: Dict[str, int] = field(default_factory=dict)
+
+    def record(self, statement: str, duration: float):
+        self.query_count += 1
+        self.total_time += duration
+        self.statements[statement] = self.statements.get(statement, 0) + 1
+
+
+_current_stats: ContextVar[Optional[RequestQueryStats]] = ContextVar("sql_profiler_stats", default=None)
+
+
+def start_request() -> RequestQueryStats:
+    """Начать сбор статистики для текущего запроса"""
+    stats = RequestQueryStats()
+    _current_stats.set(stats)
+    return stats
+
+
+def current_stats() -> Optional[RequestQueryStats]:
+    """Статистика текущего запроса (None вне запроса)"""
+    return _current_stats.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get("query_start_time")
+    if not start_times:
+        return
+    duration = time.perf_counter() - start_times.pop()
+
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.record(statement, duration)
+
+    if duration * 1000 >= SLOW_QUERY_MS:
+        logger.warning("slow_query",
+                       duration_ms=round(duration * 1000, 2),
+                       sql=normalize_sql(statement))
+
+
+def instrument_engine(engine: Engine):
+    """Подключение слушателей SQLAlchemy к движку"""
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def finish_request(stats: RequestQueryStats, method: str, route: str, debug: bool = False) -> str:
+    """
+    Завершение сбора статистики запроса
+
+    Args:
+        stats: статистика, полученная из start_request()
+        method: HTTP метод
+        route: шаблон маршрута (например, '/api/tasks/{task_id}')
+        debug: включить детектор N+1
+
+    Returns:
+        Значение заголовка Server-Timing
+    """
+    DB_QUERIES_PER_REQUEST.labels(method=method, route=route).observe(stats.query_count)
+    DB_TIME_PER_REQUEST.labels(method=method, route=route).observe(stats.total_time)
+
+    if debug:
+        for statement, executions in stats.statements.items():
+            if executions >= N_PLUS_ONE_THRESHOLD:
+                logger.warning("n_plus_one_detected",
+                               method=method,
+                               route=route,
+                               executions=executions,
+                               sql=normalize_sql(statement))
+
+    return f'db;dur={stats.total_time * 1000:.2f};desc="{stats.query_count} queries"'
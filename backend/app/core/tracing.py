@@ -0,0 +1,381 @@
+"""
+Tracing Module
+Лёгкая трассировка запросов: спаны для SQL, Redis, Vault и Keycloak,
+распространение контекста через заголовок traceparent (W3C),
+экспорт в OTLP-совместимом JSON в файл или коллектор
+
+Без TRACE_EXPORT_URL и TRACE_EXPORT_PATH спаны не создаются вовсе.
+"""
+import functools
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "0.01"))
+# Например, /var/log/task-manager/traces.jsonl; при превышении TRACE_EXPORT_MAX_BYTES
+# файл переименовывается в <путь>.1 (предыдущая копия перезаписывается)
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+TRACE_EXPORT_MAX_BYTES = int(os.getenv("TRACE_EXPORT_MAX_BYTES", str(100 * 1024 * 1024)))
+# Например, http://otel-collector:4318/v1/traces (имеет приоритет над файлом)
+TRACE_EXPORT_URL = os.getenv("TRACE_EXPORT_URL", "")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "task-manager-backend")
+EXPORT_BATCH_SIZE = int(os.getenv("TRACE_EXPORT_BATCH_SIZE", "512"))
+EXPORT_INTERVAL = float(os.getenv("TRACE_EXPORT_INTERVAL", "2.0"))
+EXPORT_QUEUE_SIZE = int(os.getenv("TRACE_EXPORT_QUEUE_SIZE", "10000"))
+
+# Виды спанов OTLP
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class Span:
+    """Спан трассировки"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind",
+                 "start_ns", "end_ns", "attributes", "status", "status_message")
+
+    sampled = True
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str],
+                 kind: int = SPAN_KIND_INTERNAL, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes or {}
+        self.status = STATUS_OK
+        self.status_message = ""
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        self.end_ns = time.time_ns()
+        exporter.submit(self)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": self.status, "message": self.status_message},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    """Спан, который ничего не записывает (трассировка выключена или не сэмплирована)"""
+
+    sampled = False
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def record_error(self, error: BaseException):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: ContextVar[Optional[Any]] = ContextVar("current_span", default=None)
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def parse_traceparent(header: Optional[str]):
+    """Разбор traceparent: (trace_id, parent_span_id, sampled) или None"""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        flags = int(parts[3], 16)
+        int(parts[1], 16)
+        int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 0x01)
+
+
+def trace_id_sampled(trace_id: str) -> bool:
+    """
+    Сэмплирование по trace_id с вероятностью TRACE_SAMPLE_RATIO
+
+    Решение детерминировано: все поды, получившие трассу, решают одинаково.
+    """
+    return int(trace_id[16:], 16) < TRACE_SAMPLE_RATIO * (1 << 64)
+
+
+def current_span():
+    """Текущий спан (или None вне трассировки)"""
+    return _current_span.get()
+
+
+@contextmanager
+def start_span(name: str, kind: int = SPAN_KIND_INTERNAL, attributes: Optional[Dict[str, Any]] = None):
+    """Дочерний спан текущего; вне сэмплированной трассировки ничего не стоит"""
+    parent = _current_span.get()
+    if parent is None or not parent.sampled:
+        yield NOOP_SPAN
+        return
+
+    span = Span(name, parent.trace_id, parent.span_id, kind, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+
+def start_request_span(name: str, traceparent: Optional[str], attributes: Optional[Dict[str, Any]] = None):
+    """
+    Корневой спан входящего запроса
+
+    Флаг sampled из traceparent не может поднять долю выше TRACE_SAMPLE_RATIO
+    (иначе любой клиент включал бы трассировку своих запросов заголовком):
+    трасса записывается, только если её trace_id проходит и локальный порог.
+
+    Returns:
+        (span, token) — token нужен для end_request_span()
+    """
+    if not TRACING_ENABLED or not (TRACE_EXPORT_URL or TRACE_EXPORT_PATH):
+        return NOOP_SPAN, _current_span.set(NOOP_SPAN)
+
+    parsed = parse_traceparent(traceparent)
+    if parsed:
+        trace_id, parent_id, sampled = parsed
+    else:
+        trace_id, parent_id, sampled = f"{random.getrandbits(128):032x}", None, True
+
+    if not (sampled and trace_id_sampled(trace_id)):
+        return NOOP_SPAN, _current_span.set(NOOP_SPAN)
+
+    span = Span(name, trace_id, parent_id, SPAN_KIND_SERVER, attributes)
+    return span, _current_span.set(span)
+
+
+def end_request_span(span, token):
+    """Завершение корневого спана запроса"""
+    _current_span.reset(token)
+    span.end()
+
+
+def traced(name: str, kind: int = SPAN_KIND_INTERNAL):
+    """Декоратор: выполнить функцию внутри спана"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with start_span(name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ==================== EXPORT ====================
+
+class SpanExporter:
+    """Фоновый экспорт завершённых спанов пачками в OTLP JSON"""
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def submit(self, span: Span):
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch: List[Span] = []
+            try:
+                batch.append(self._queue.get(timeout=EXPORT_INTERVAL))
+                while len(batch) < EXPORT_BATCH_SIZE:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if batch:
+                try:
+                    self._export(batch)
+                except Exception as e:
+                    logger.warning("trace_export_failed", spans=len(batch), error=str(e))
+
+    def _export(self, batch: List[Span]):
+        payload = json.dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", TRACE_SERVICE_NAME)]},
+                "scopeSpans": [{
+                    "scope": {"name": "task-manager.tracing"},
+                    "spans": [span.to_otlp() for span in batch],
+                }],
+            }]
+        })
+
+        if TRACE_EXPORT_URL:
+            request = urllib.request.Request(
+                TRACE_EXPORT_URL,
+                data=payload.encode(),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            urllib.request.urlopen(request, timeout=5).close()
+        elif TRACE_EXPORT_PATH:
+            try:
+                if os.path.getsize(TRACE_EXPORT_PATH) >= TRACE_EXPORT_MAX_BYTES:
+                    os.replace(TRACE_EXPORT_PATH, f"{TRACE_EXPORT_PATH}.1")
+            except FileNotFoundError:
+                pass
+            with open(TRACE_EXPORT_PATH, "a") as f:
+                f.write(payload + "\n")
+
+
+exporter = SpanExporter()
+
+
+# ==================== INSTRUMENTATION ====================
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    parent = _current_span.get()
+    if parent is None or not parent.sampled:
+        return
+    span = Span("db.query", parent.trace_id, parent.span_id, SPAN_KIND_CLIENT, {
+        "db.system": "postgresql",
+        "db.statement": statement[:1000],
+    })
+    conn.info.setdefault("trace_spans", []).append(span)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("trace_spans")
+    if spans:
+        spans.pop().end()
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    spans = conn.info.get("trace_spans") if conn is not None else None
+    if spans:
+        span = spans.pop()
+        span.record_error(exception_context.original_exception)
+        span.end()
+
+
+def instrument_engine(engine):
+    """Спаны для SQL-запросов движка SQLAlchemy (повторный вызов ничего не делает)"""
+    from sqlalchemy import event
+
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def instrument_redis(client):
+    """Спаны для всех команд Redis клиента"""
+    execute_command = client.execute_command
+
+    @functools.wraps(execute_command)
+    def traced_execute_command(*args, **options):
+        parent = _current_span.get()
+        if parent is None or not parent.sampled:
+            return execute_command(*args, **options)
+        command = str(args[0]) if args else "UNKNOWN"
+        with start_span(f"redis.{command}", SPAN_KIND_CLIENT, {"db.system": "redis"}):
+            return execute_command(*args, **options)
+
+    client.execute_command = traced_execute_command
+
+
+def instrument_requests():
+    """
+    Спаны для исходящих HTTP-запросов через requests (Vault hvac и Keycloak)
+    с передачей traceparent
+    """
+    import requests
+
+    if getattr(requests.Session.request, "_traced", False):
+        return
+    original_request = requests.Session.request
+
+    @functools.wraps(original_request)
+    def traced_request(self, method, url, *args, **kwargs):
+        parent = _current_span.get()
+        if parent is None or not parent.sampled:
+            return original_request(self, method, url, *args, **kwargs)
+
+        with start_span(f"HTTP {method.upper()}", SPAN_KIND_CLIENT, {
+            "http.method": method.upper(),
+            "http.url": url.split("?")[0],
+            "net.peer.name": urllib.parse.urlsplit(url).hostname or "",
+        }) as span:
+            headers = dict(kwargs.pop("headers", None) or {})
+            headers["traceparent"] = span.traceparent()
+            response = original_request(self, method, url, *args, headers=headers, **kwargs)
+            span.set_attribute("http.status_code", response.status_code)
+            return response
+
+    traced_request._traced = True
+    requests.Session.request = traced_request
@@ -9,6 +9,8 @@ from typing import Dict, Any, Optional
 from tenacity import retry, stop_after_attempt, wait_exponential
 import structlog
 
+from .tracing import traced
+
 logger = structlog.get_logger(__name__)
 
 
@@ -71,6 +73,7 @@ class VaultClient:
             logger.error("kubernetes_auth_failed", error=str(e))
             raise
     
+    @traced("vault.get_secret")
     def get_secret(self, path: str, key: Optional[str] = None) -> Any:
         """
         Получение секрета из Vault
@@ -2,15 +2,22 @@
 Task Manager Pro - Main Application
 FastAPI приложение с Vault и Keycloak SSO интеграцией
 """
-from fastapi import FastAPI, HTTPException, status, Depends
+from fastapi import FastAPI, HTTPException, status, Depends, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
 from contextlib import asynccontextmanager
 from sqlalchemy.orm import Session
-from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import Counter, Histogram, Gauge, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import multiprocess
+from sqlalchemy import event, select, union_all, update, delete, case, func
+import json
+import os
 import time
 import structlog
-from typing import Optional, List
+from typing import Literal, Optional, List
+from datetime import datetime
 
 from .core.config import settings
 from .core.database import init_db, get_db, check_db_connection, engine
@@ -18,27 +25,55 @@ from .core.redis_client import redis_client
 from .core.vault import vault_client
 from .core.keycloak import keycloak_client, init_keycloak_from_vault
 from .core.security import get_current_user, get_current_active_admin
+from .core import sql_profiler, tracing
+from .core.log_pipeline import configure_logging, shutdown_logging
+from .core.archive import archiver, archive_table
+from .core.schema import apply_schema_extensions, tag_counts_table
+from .core.sharding import shard_router, get_task_db, ensure_writable
+from .core.serialization import parse_fields, encode_rows
+from .core.cache import tasks_list_cache, task_cache, tasks_list_key, task_key
+from .core.compression import compressed_response
+from .core.revocation import revocation_list, bearer_token
+from .core.reminders import schedule_reminder, cancel_reminder
+from .core.analytics import rollup_refresher, mark_deleted
+from .core.rate_limit import rate_limit, ip_rate_limit, load_shedder, REQUESTS_SHED, SHED_RETRY_AFTER
 from .models.models import User, Task, PriorityEnum, StatusEnum
 from .schemas import schemas
-from .api import auth
-
-# Настройка логирования
-structlog.configure(
-    processors=[
-        structlog.stdlib.filter_by_level,
-        structlog.processors.TimeStamper(fmt="iso"),
-        structlog.processors.JSONRenderer()
-    ],
-    logger_factory=structlog.stdlib.LoggerFactory(),
-)
+from .api import auth, profiling, analytics
+
+# Настройка логирования (асинхронная пакетная запись, сэмплирование горячих событий)
+configure_logging(level=vault_client.get_monitoring_config()["log_level"])
 
 logger = structlog.get_logger(__name__)
 
 # Prometheus метрики
 REQUEST_COUNT = Counter('http_requests_total', 'Total requests', ['method', 'endpoint', 'status'])
 REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Request duration', ['method', 'endpoint'])
-ACTIVE_REQUESTS = Gauge('http_requests_active', 'Active requests')
-DB_CONNECTIONS = Gauge('database_connections_active', 'Active DB connections')
+DB_CONNECTIONS = Gauge('database_connections_active', 'Active DB connections', multiprocess_mode='livesum')
+
+# Мультипроцессный режим (несколько воркеров, см. app/server.py)
+MULTIPROCESS_METRICS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def instrument_engine(db_engine):
+    """Метрики пула, профилирование SQL и трассировка для движка (основная база и шарды)"""
+    # Занятые соединения считаются по событиям пула, чтобы значение
+    # каждого воркера было актуальным, а не только того, кто обслужил /metrics
+    event.listen(db_engine.pool, "checkout", lambda *args: DB_CONNECTIONS.inc())
+    event.listen(db_engine.pool, "checkin", lambda *args: DB_CONNECTIONS.dec())
+
+    # Профилирование SQL по запросам
+    sql_profiler.instrument_engine(db_engine)
+
+    # Трассировка запросов PostgreSQL
+    tracing.instrument_engine(db_engine)
+
+
+instrument_engine(engine)
+
+# Трассировка: Redis, исходящие HTTP (Vault, Keycloak)
+tracing.instrument_redis(redis_client.client)
+tracing.instrument_requests()
 
 
 # Lifecycle management
@@ -51,6 +86,11 @@ async def lifespan(app: FastAPI):
     try:
         # Инициализация БД
         init_db()
+        apply_schema_extensions()
+        for number, shard_engine in shard_router.engines.items():
+            if number != 0:
+                instrument_engine(shard_engine)
+        shard_router.init_shards(apply_schema_extensions)
         logger.info("database_initialized")
         
         # Инициализация Keycloak из Vault
@@ -78,12 +118,27 @@ async def lifespan(app: FastAPI):
         logger.error("application_startup_failed", error=str(e))
         raise
     
+    # Фоновая архивация старых завершённых задач
+    archiver.start()
+    
+    # Синхронизация фильтра отозванных токенов
+    revocation_list.start()
+    
+    # Инкрементальное обновление агрегатов для аналитики
+    rollup_refresher.start()
+    
     yield
     
     # Shutdown
     logger.info("application_shutting_down")
+    await archiver.stop()
+    await rollup_refresher.stop()
+    revocation_list.stop()
     redis_client.close()
+    if MULTIPROCESS_METRICS:
+        multiprocess.mark_process_dead(os.getpid())
     logger.info("application_stopped")
+    shutdown_logging()
 
 
 # FastAPI app
@@ -97,20 +152,10 @@ app = FastAPI(
     openapi_url="/api/openapi.json"
 )
 
-# CORS Middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=settings.cors_origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
 # Metrics Middleware
 @app.middleware("http")
 async def metrics_middleware(request, call_next):
     """Middleware для сбора метрик"""
-    ACTIVE_REQUESTS.inc()
     start_time = time.time()
     
     response = await call_next(request)
@@ -125,13 +170,133 @@ async def metrics_middleware(request, call_next):
         method=request.method,
         endpoint=request.url.path
     ).observe(duration)
-    ACTIVE_REQUESTS.dec()
     
     return response
 
 
+def route_template(request) -> str:
+    """Шаблон маршрута запроса (например, '/api/tasks/{task_id}')"""
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", request.url.path)
+    return "unmatched"
+
+
+# SQL Profiling Middleware
+@app.middleware("http")
+async def sql_profiling_middleware(request, call_next):
+    """Middleware для подсчёта SQL-запросов и времени в БД"""
+    stats = sql_profiler.start_request()
+    
+    response = await call_next(request)
+    
+    response.headers["Server-Timing"] = sql_profiler.finish_request(
+        stats,
+        method=request.method,
+        route=route_template(request),
+        debug=settings.debug
+    )
+    
+    return response
+
+
+# Token Revocation Middleware
+@app.middleware("http")
+async def token_revocation_middleware(request, call_next):
+    """Middleware для отказа (401) по отозванным токенам"""
+    token = bearer_token(request.headers.get("authorization"))
+    if token and revocation_list.is_revoked(token):
+        return JSONResponse(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            content={"detail": "Token has been revoked"},
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    
+    return await call_next(request)
+
+
+# Служебные пути не ограничиваются и не отклоняются при перегрузке
+SHED_EXEMPT_PATHS = {"/health", "/ready", "/metrics"}
+
+
+# IP Rate Limit Middleware
+@app.middleware("http")
+async def ip_rate_limit_middleware(request, call_next):
+    """Middleware для лимита по IP (429) до аутентификации"""
+    if request.url.path in SHED_EXEMPT_PATHS:
+        return await call_next(request)
+    
+    retry_after = ip_rate_limit(request)
+    if retry_after:
+        return JSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            content={"detail": "Too many requests"},
+            headers={"Retry-After": str(retry_after)}
+        )
+    
+    return await call_next(request)
+
+
+# Load Shedding Middleware
+@app.middleware("http")
+async def load_shedding_middleware(request, call_next):
+    """Middleware для быстрого отказа (503) при перегрузке и учёта активных запросов"""
+    reason = None if request.url.path in SHED_EXEMPT_PATHS else load_shedder.should_shed()
+    if reason:
+        REQUESTS_SHED.labels(reason=reason).inc()
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"detail": "Service overloaded, retry later"},
+            headers={"Retry-After": str(SHED_RETRY_AFTER)}
+        )
+    
+    with load_shedder.track():
+        return await call_next(request)
+
+
+# Tracing Middleware
+@app.middleware("http")
+async def tracing_middleware(request, call_next):
+    """Middleware для корневого спана запроса"""
+    span, token = tracing.start_request_span(
+        f"{request.method} {request.url.path}",
+        request.headers.get("traceparent"),
+        {"http.method": request.method, "http.target": request.url.path}
+    )
+    try:
+        response = await call_next(request)
+    except Exception as e:
+        span.record_error(e)
+        tracing.end_request_span(span, token)
+        raise
+    
+    if span.sampled:
+        span.name = f"{request.method} {route_template(request)}"
+        span.set_attribute("http.status_code", response.status_code)
+        response.headers["traceparent"] = span.traceparent()
+    tracing.end_request_span(span, token)
+    
+    return response
+
+
+# CORS Middleware
+# Добавляется последним и поэтому оборачивает все остальные: ответы, которые
+# middleware выше возвращают сами (401 отозванного токена, 503 при перегрузке),
+# тоже получают CORS-заголовки и читаются браузером
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=settings.cors_origins,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
 # Include routers
 app.include_router(auth.router)
+app.include_router(profiling.router)
+app.include_router(analytics.router)
 
 
 # ==================== HEALTH ENDPOINTS ====================
@@ -176,25 +341,63 @@ async def readiness_check():
 @app.get("/metrics", tags=["Monitoring"])
 async def metrics():
     """Prometheus метрики"""
-    DB_CONNECTIONS.set(engine.pool.checkedout())
+    if MULTIPROCESS_METRICS:
+        # Агрегация метрик всех воркеров
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
     return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
 # ==================== TASKS CRUD ====================
 
-@app.post("/api/tasks", response_model=schemas.TaskResponse, status_code=201, tags=["Tasks"])
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """Версия задачи из заголовка If-Match ('"3"', 'W/"3"'); None для '*' или отсутствия"""
+    if not if_match or if_match.strip() == "*":
+        return None
+    value = if_match.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid If-Match header")
+
+
+def task_etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def raise_missing_or_conflict(db: Session, task_id: int, owner_id: int):
+    """Запись не затронута: 404, если задачи нет, иначе 409 (устаревшая версия)"""
+    current_version = db.query(Task.version).filter(
+        Task.id == task_id,
+        Task.owner_id == owner_id
+    ).scalar()
+    if current_version is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    raise HTTPException(
+        status_code=409,
+        detail="Task was modified by another request",
+        headers={"ETag": task_etag(current_version)}
+    )
+
+
+@app.post("/api/tasks", response_model=schemas.TaskResponse, status_code=201, dependencies=[Depends(rate_limit)], tags=["Tasks"])
 async def create_task(
     task_data: schemas.TaskCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_task_db),
     current_user: User = Depends(get_current_user)
 ):
     """Создание новой задачи"""
+    ensure_writable(db)
     task = Task(
         title=task_data.title,
         description=task_data.description,
         priority=task_data.priority,
         status=task_data.status,
         due_date=task_data.due_date,
+        tags=task_data.tags,
         owner_id=current_user.id
     )
     
@@ -203,136 +406,240 @@ async def create_task(
     db.refresh(task)
     
     # Инвалидируем кэш
-    redis_client.flush_pattern("tasks:list:*")
+    tasks_list_cache.flush("tasks:list:*")
+    
+    schedule_reminder(task.id, task.owner_id, task.due_date, task.completed)
     
     logger.info("task_created", task_id=task.id, user_id=current_user.id)
     
     return task
 
 
-@app.get("/api/tasks", response_model=List[schemas.TaskResponse], tags=["Tasks"])
+@app.get(
+    "/api/tasks",
+    response_class=Response,
+    responses={200: {"model": List[schemas.TaskListItem], "description": "Задачи (только поля из ?fields=)"}},
+    dependencies=[Depends(rate_limit)],
+    tags=["Tasks"]
+)
 async def list_tasks(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
     status: Optional[StatusEnum] = None,
     priority: Optional[PriorityEnum] = None,
-    db: Session = Depends(get_db),
+    include_archived: bool = False,
+    fields: Optional[str] = None,
+    tags: Optional[str] = None,
+    tags_match: Literal["any", "all"] = "any",
+    db: Session = Depends(get_task_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Список задач с фильтрацией и кэшированием"""
-    cache_key = f"{current_user.id}:{skip}:{limit}:{status}:{priority}"
-    
-    # Проверяем кэш
-    cached = redis_client.get_cached_tasks_list(cache_key)
-    if cached:
-        logger.debug("cache_hit", key=cache_key)
-        return cached
-    
-    # Запрос к БД
-    query = db.query(Task).filter(Task.owner_id == current_user.id)
-    
-    if status:
-        query = query.filter(Task.status == status)
-    if priority:
-        query = query.filter(Task.priority == priority)
-    
-    tasks = query.order_by(Task.created_at.desc()).offset(skip).limit(limit).all()
+    """
+    Список задач с фильтрацией и кэшированием
+    
+    При промахе кэша выбираются только нужные колонки (?fields=id,title,status),
+    строки кодируются в JSON напрямую, без ORM-объектов и повторной валидации.
+    Фильтр ?tags=a,b: любой из тегов (tags_match=any) или все (tags_match=all),
+    оба варианта используют GIN-индекс.
+    """
+    selected = parse_fields(fields)
+    tag_list = sorted({tag.strip() for tag in tags.split(",") if tag.strip()}) if tags else []
+    cache_key = (
+        f"{current_user.id}:{skip}:{limit}:{status}:{priority}:{include_archived}:{','.join(selected)}"
+        f":{tags_match}:{','.join(tag_list)}"
+    )
     
-    # Сериализация для кэша
-    tasks_dict = [schemas.TaskResponse.model_validate(task).model_dump() for task in tasks]
+    def project(source):
+        query = select(*[source.c[name] for name in selected]).where(source.c.owner_id == current_user.id)
+        if status:
+            query = query.where(source.c.status == status)
+        if priority:
+            query = query.where(source.c.priority == priority)
+        if tag_list:
+            if tags_match == "all":
+                query = query.where(source.c.tags.contains(tag_list))
+            else:
+                query = query.where(source.c.tags.overlap(tag_list))
+        return query
+    
+    def load_tasks():
+        if include_archived:
+            # Горячая и архивная таблицы вместе
+            order_source = union_all(
+                project(Task.__table__).add_columns(Task.__table__.c.created_at.label("_order")),
+                project(archive_table).add_columns(archive_table.c.created_at.label("_order"))
+            ).subquery()
+            query = select(*[order_source.c[name] for name in selected]).order_by(order_source.c._order.desc())
+        else:
+            # Только горячая таблица
+            query = project(Task.__table__).order_by(Task.__table__.c.created_at.desc())
+        
+        rows = db.execute(query.offset(skip).limit(limit))
+        return encode_rows(selected, rows)
     
-    # Кэшируем на 5 минут
-    redis_client.cache_tasks_list(cache_key, tasks_dict, expire=300)
+    # Кэш на 5 минут; при промахе пересчитывает только один запрос.
+    # Сжатый вариант страницы хранится рядом с записью кэша
+    key = tasks_list_key(cache_key)
+    payload = await tasks_list_cache.get_or_compute(key, load_tasks, ttl=300)
+    return await compressed_response(request, payload.encode(), cache_key=key, ttl=300)
+
+
+@app.get("/api/tasks/archived", response_model=List[schemas.TaskResponse], dependencies=[Depends(rate_limit)], tags=["Tasks"])
+async def list_archived_tasks(
+    skip: int = 0,
+    limit: int = 100,
+    completed_after: Optional[datetime] = None,
+    completed_before: Optional[datetime] = None,
+    db: Session = Depends(get_task_db),
+    current_user: User = Depends(get_current_user)
+):
+    """История: архивные задачи (диапазон дат ограничивает просматриваемые секции)"""
+    query = select(*[archive_table.c[c.name] for c in Task.__table__.columns]).where(
+        archive_table.c.owner_id == current_user.id
+    )
+    if completed_after:
+        query = query.where(archive_table.c.completed_at >= completed_after)
+    if completed_before:
+        query = query.where(archive_table.c.completed_at < completed_before)
     
-    return tasks
+    rows = db.execute(
+        query.order_by(archive_table.c.completed_at.desc()).offset(skip).limit(limit)
+    ).mappings()
+    return [dict(row) for row in rows]
 
 
-@app.get("/api/tasks/{task_id}", response_model=schemas.TaskResponse, tags=["Tasks"])
+@app.get("/api/tasks/{task_id}", response_model=schemas.TaskResponse, dependencies=[Depends(rate_limit)], tags=["Tasks"])
 async def get_task(
     task_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: Session = Depends(get_task_db),
     current_user: User = Depends(get_current_user)
 ):
     """Получение задачи по ID"""
-    # Проверяем кэш
-    cached = redis_client.get_cached_task(task_id)
-    if cached:
-        return cached
-    
-    task = db.query(Task).filter(
-        Task.id == task_id,
-        Task.owner_id == current_user.id
-    ).first()
-    
-    if not task:
+    def load_task():
+        task = db.query(Task).filter(
+            Task.id == task_id,
+            Task.owner_id == current_user.id
+        ).first()
+        if not task:
+            return None
+        return schemas.TaskResponse.model_validate(task).model_dump(mode="json")
+    
+    key = task_key(current_user.id, task_id)
+    task_dict = await task_cache.get_or_compute(key, load_task, ttl=300)
+    if task_dict is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    # Кэшируем
-    task_dict = schemas.TaskResponse.model_validate(task).model_dump()
-    redis_client.cache_task(task_id, task_dict)
-    
-    return task
+    # Значение уже в JSON-виде (model_dump(mode="json")), повторная валидация не нужна
+    body = json.dumps(task_dict, separators=(",", ":")).encode()
+    return await compressed_response(
+        request, body, cache_key=key, ttl=300,
+        headers={"ETag": task_etag(task_dict.get("version", 1))}
+    )
 
 
-@app.put("/api/tasks/{task_id}", response_model=schemas.TaskResponse, tags=["Tasks"])
+@app.put("/api/tasks/{task_id}", response_model=schemas.TaskResponse, dependencies=[Depends(rate_limit)], tags=["Tasks"])
 async def update_task(
     task_id: int,
     task_update: schemas.TaskUpdate,
-    db: Session = Depends(get_db),
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: Session = Depends(get_task_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Обновление задачи"""
-    task = db.query(Task).filter(
-        Task.id == task_id,
-        Task.owner_id == current_user.id
-    ).first()
+    """Обновление задачи (один UPDATE ... RETURNING, версия проверяется по If-Match)"""
+    ensure_writable(db)
+    expected_version = parse_if_match(if_match)
+    update_data = task_update.model_dump(exclude_unset=True)
     
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+    if "completed" in update_data:
+        update_data["completed_at"] = case(
+            (Task.completed.is_(True), Task.completed_at),
+            else_=func.now()
+        ) if update_data["completed"] else None
     
-    # Обновляем поля
-    update_data = task_update.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(task, field, value)
+    stmt = update(Task).where(
+        Task.id == task_id,
+        Task.owner_id == current_user.id
+    )
+    if expected_version is not None:
+        stmt = stmt.where(Task.version == expected_version)
     
+    stmt = stmt.values(**update_data, version=Task.version + 1).returning(*Task.__table__.columns)
+    row = db.execute(stmt, execution_options={"synchronize_session": False}).mappings().first()
     db.commit()
-    db.refresh(task)
+    
+    if row is None:
+        raise_missing_or_conflict(db, task_id, current_user.id)
     
     # Инвалидируем кэш
-    redis_client.invalidate_task_cache(task_id)
+    tasks_list_cache.flush("tasks:list:*")
+    task_cache.delete(task_key(current_user.id, task_id))
+    
+    if "due_date" in update_data or "completed" in update_data:
+        schedule_reminder(task_id, current_user.id, row["due_date"], row["completed"])
     
     logger.info("task_updated", task_id=task_id, user_id=current_user.id)
     
-    return task
+    response.headers["ETag"] = task_etag(row["version"])
+    return dict(row)
 
 
-@app.delete("/api/tasks/{task_id}", status_code=204, tags=["Tasks"])
+@app.delete("/api/tasks/{task_id}", status_code=204, dependencies=[Depends(rate_limit)], tags=["Tasks"])
 async def delete_task(
     task_id: int,
-    db: Session = Depends(get_db),
+    if_match: Optional[str] = Header(None),
+    db: Session = Depends(get_task_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Удаление задачи"""
-    task = db.query(Task).filter(
+    """Удаление задачи (один DELETE ... RETURNING)"""
+    ensure_writable(db)
+    expected_version = parse_if_match(if_match)
+    
+    stmt = delete(Task).where(
         Task.id == task_id,
         Task.owner_id == current_user.id
-    ).first()
-    
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+    )
+    if expected_version is not None:
+        stmt = stmt.where(Task.version == expected_version)
     
-    db.delete(task)
+    deleted_id = db.execute(
+        stmt.returning(Task.id),
+        execution_options={"synchronize_session": False}
+    ).scalar()
     db.commit()
     
+    if deleted_id is None:
+        raise_missing_or_conflict(db, task_id, current_user.id)
+    
     # Инвалидируем кэш
-    redis_client.invalidate_task_cache(task_id)
+    tasks_list_cache.flush("tasks:list:*")
+    task_cache.delete(task_key(current_user.id, task_id))
+    
+    cancel_reminder(task_id, current_user.id)
+    mark_deleted(task_id)
     
     logger.info("task_deleted", task_id=task_id, user_id=current_user.id)
 
 
+# ==================== SESSIONS ====================
+
+@app.post("/api/auth/logout", status_code=204, tags=["Authentication"])
+async def logout(
+    authorization: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    """Выход: текущий access-токен отзывается на всех подах (см. app/core/revocation.py)"""
+    token = bearer_token(authorization)
+    if token:
+        revocation_list.revoke(token)
+    logger.info("user_logged_out", user_id=current_user.id)
+
+
 # ==================== USERS ====================
 
-@app.get("/api/users", response_model=List[schemas.UserResponse], tags=["Users"])
+@app.get("/api/users", response_model=List[schemas.UserResponse], dependencies=[Depends(rate_limit)], tags=["Users"])
 async def list_users(
     skip: int = 0,
     limit: int = 100,
@@ -346,37 +653,90 @@ async def list_users(
 
 # ==================== STATISTICS ====================
 
-@app.get("/api/stats", response_model=schemas.StatsResponse, tags=["Statistics"])
+def task_counts(db: Session, owner_id: Optional[int] = None):
+    """Число задач по (status, priority, completed) в горячей и архивной таблицах"""
+    sources = []
+    for source in (Task.__table__, archive_table):
+        query = select(source.c.status, source.c.priority, source.c.completed)
+        if owner_id is not None:
+            query = query.where(source.c.owner_id == owner_id)
+        sources.append(query)
+    rows = union_all(*sources).subquery()
+    return db.execute(
+        select(rows.c.status, rows.c.priority, rows.c.completed, func.count()).group_by(
+            rows.c.status, rows.c.priority, rows.c.completed
+        )
+    ).all()
+
+
+@app.get("/api/stats", response_model=schemas.StatsResponse, dependencies=[Depends(rate_limit)], tags=["Statistics"])
 async def get_statistics(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_task_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Статистика по задачам пользователя"""
-    from sqlalchemy import func
-    
-    total = db.query(func.count(Task.id)).filter(Task.owner_id == current_user.id).scalar()
-    completed = db.query(func.count(Task.id)).filter(
-        Task.owner_id == current_user.id,
-        Task.completed == True
-    ).scalar()
-    
-    by_status = db.query(Task.status, func.count(Task.id)).filter(
-        Task.owner_id == current_user.id
-    ).group_by(Task.status).all()
+    """Статистика по задачам пользователя (включая архив)"""
+    total = completed = 0
+    by_status, by_priority = {}, {}
+    for task_status, task_priority, task_completed, count in task_counts(db, current_user.id):
+        total += count
+        if task_completed:
+            completed += count
+        by_status[str(task_status)] = by_status.get(str(task_status), 0) + count
+        by_priority[str(task_priority)] = by_priority.get(str(task_priority), 0) + count
+    
+    # Счётчики по тегам горячей таблицы поддерживаются триггером (см. app/core/schema.py);
+    # при архивации они уменьшаются, поэтому теги архива считаются отдельно
+    by_tag = dict(db.execute(
+        select(tag_counts_table.c.tag, tag_counts_table.c.count).where(
+            tag_counts_table.c.owner_id == current_user.id,
+            tag_counts_table.c.count > 0
+        )
+    ).all())
+    archived_tags = select(func.unnest(archive_table.c.tags).label("tag")).where(
+        archive_table.c.owner_id == current_user.id
+    ).subquery()
+    for tag, count in db.execute(
+        select(archived_tags.c.tag, func.count()).group_by(archived_tags.c.tag)
+    ).all():
+        by_tag[tag] = by_tag.get(tag, 0) + count
     
-    by_priority = db.query(Task.priority, func.count(Task.id)).filter(
-        Task.owner_id == current_user.id
-    ).group_by(Task.priority).all()
+    return {
+        "total_tasks": total,
+        "completed_tasks": completed,
+        "active_tasks": total - completed,
+        "by_status": by_status,
+        "by_priority": by_priority,
+        "by_tag": dict(sorted(by_tag.items(), key=lambda item: (-item[1], item[0])))
+    }
+
+
+@app.get("/api/admin/stats", response_model=schemas.StatsResponse, dependencies=[Depends(rate_limit)], tags=["Statistics"])
+async def get_global_statistics(
+    current_user: User = Depends(get_current_active_admin)
+):
+    """Статистика по всем задачам, включая архив (только для админов; шарды опрашиваются параллельно)"""
+    results = await run_in_threadpool(shard_router.fan_out, task_counts)
+    
+    total = completed = 0
+    by_status, by_priority = {}, {}
+    for rows in results:
+        for task_status, task_priority, task_completed, count in rows:
+            total += count
+            if task_completed:
+                completed += count
+            by_status[str(task_status)] = by_status.get(str(task_status), 0) + count
+            by_priority[str(task_priority)] = by_priority.get(str(task_priority), 0) + count
     
     return {
-        "total_tasks": total or 0,
-        "completed_tasks": completed or 0,
-        "active_tasks": (total or 0) - (completed or 0),
-        "by_status": {str(status): count for status, count in by_status},
-        "by_priority": {str(priority): count for priority, count in by_priority}
+        "total_tasks": total,
+        "completed_tasks": completed,
+        "active_tasks": total - completed,
+        "by_status": by_status,
+        "by_priority": by_priority
     }
 
 
 if __name__ == "__main__":
+    # Несколько воркеров: python -m app.server
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
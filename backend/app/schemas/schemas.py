@@ -1,8 +1,8 @@
 """
 Pydantic Schemas для валидации и сериализации
 """
-from pydantic import BaseModel, EmailStr, Field, ConfigDict
-from typing import Optional, Dict
+from pydantic import BaseModel, EmailStr, Field, ConfigDict, field_validator
+from typing import Optional, Dict, List
 from datetime import datetime
 from ..models.models import PriorityEnum, StatusEnum
 
@@ -57,12 +57,37 @@ class UserResponse(UserBase):
 
 # ==================== TASK SCHEMAS ====================
 
+MAX_TAGS = 20
+MAX_TAG_LENGTH = 50
+
+
+def normalize_tags(tags: Optional[List[str]]) -> Optional[List[str]]:
+    """Теги без пробелов по краям и повторов, в исходном порядке"""
+    if tags is None:
+        return None
+    result = []
+    for tag in tags:
+        tag = tag.strip()
+        if not tag:
+            continue
+        if len(tag) > MAX_TAG_LENGTH:
+            raise ValueError(f"Tag is longer than {MAX_TAG_LENGTH} characters")
+        if tag not in result:
+            result.append(tag)
+    if len(result) > MAX_TAGS:
+        raise ValueError(f"At most {MAX_TAGS} tags are allowed")
+    return result
+
+
 class TaskBase(BaseModel):
     title: str = Field(..., min_length=1, max_length=200)
     description: Optional[str] = None
     priority: PriorityEnum = PriorityEnum.MEDIUM
     status: StatusEnum = StatusEnum.TODO
     due_date: Optional[datetime] = None
+    tags: List[str] = Field(default_factory=list)
+    
+    _normalize_tags = field_validator("tags")(normalize_tags)
 
 
 class TaskCreate(TaskBase):
@@ -76,6 +101,9 @@ class TaskUpdate(BaseModel):
     status: Optional[StatusEnum] = None
     completed: Optional[bool] = None
     due_date: Optional[datetime] = None
+    tags: Optional[List[str]] = None
+    
+    _normalize_tags = field_validator("tags")(normalize_tags)
 
 
 class TaskResponse(TaskBase):
@@ -85,10 +113,33 @@ class TaskResponse(TaskBase):
     created_at: datetime
     updated_at: datetime
     owner_id: int
+    version: int = 1
     
     model_config = ConfigDict(from_attributes=True)
 
 
+class TaskListItem(BaseModel):
+    """
+    Элемент ответа GET /api/tasks — проекция TaskResponse
+
+    Содержит только поля из ?fields=id,title,... (без параметра — все поля
+    TaskResponse); поля вне проекции в ответе отсутствуют, а не равны null.
+    """
+    title: Optional[str] = None
+    description: Optional[str] = None
+    priority: Optional[PriorityEnum] = None
+    status: Optional[StatusEnum] = None
+    due_date: Optional[datetime] = None
+    tags: Optional[List[str]] = None
+    id: Optional[int] = None
+    completed: Optional[bool] = None
+    completed_at: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    owner_id: Optional[int] = None
+    version: Optional[int] = None
+
+
 # ==================== STATISTICS SCHEMAS ====================
 
 class StatsResponse(BaseModel):
@@ -97,3 +148,4 @@ class StatsResponse(BaseModel):
     active_tasks: int
     by_status: Dict[str, int]
     by_priority: Dict[str, int]
+    by_tag: Dict[str, int] = {}
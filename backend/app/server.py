@@ -0,0 +1,91 @@
+"""
+Task Manager Pro - Server Entry Point
+Запуск uvicorn с несколькими воркерами и мультипроцессными метриками Prometheus
+
+    python -m app.server                 # воркеров по числу доступных CPU
+    WEB_CONCURRENCY=4 python -m app.server
+"""
+import argparse
+import glob
+import os
+
+DEFAULT_MULTIPROC_DIR = "/tmp/prometheus-multiproc"
+
+
+def available_cpus() -> int:
+    """Число CPU, доступных процессу (с учётом affinity и квоты cgroup)"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # Квота CPU контейнера (cgroup v2), например '200000 100000' = 2 CPU
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+
+    return max(1, cpus)
+
+
+def per_worker_pool_sizes(workers: int) -> dict:
+    """
+    Размеры пула PostgreSQL на воркер, чтобы суммарно под не превышал бюджет соединений
+
+    Бюджет задаётся на под и на базу: DB_MAX_CONNECTIONS. Результат читают
+    движки шардов (app/core/sharding.py) — каждый воркер держит свой пул на каждый шард.
+    """
+    db_budget = int(os.getenv("DB_MAX_CONNECTIONS", "20"))
+
+    db_per_worker = max(2, db_budget // workers)
+    pool_size = max(1, db_per_worker * 2 // 3)
+    return {
+        "DB_POOL_SIZE": str(pool_size),
+        "DB_MAX_OVERFLOW": str(db_per_worker - pool_size),
+    }
+
+
+def prepare_multiprocess_metrics(workers: int):
+    """
+    Каталог для метрик prometheus_client
+
+    При каждом запуске удаляются только файлы метрик (*.db) прошлых процессов:
+    PROMETHEUS_MULTIPROC_DIR может указывать на общий или смонтированный каталог.
+    """
+    if workers <= 1:
+        os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+        return
+    path = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", DEFAULT_MULTIPROC_DIR)
+    os.makedirs(path, exist_ok=True)
+    for stale in glob.glob(os.path.join(path, "*.db")):
+        try:
+            os.remove(stale)
+        except FileNotFoundError:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Task Manager API server")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "0")),
+                        help="число воркеров (0 = по числу CPU)")
+    parser.add_argument("--app", default="app.main:app")
+    args = parser.parse_args()
+
+    workers = args.workers or available_cpus()
+
+    # Окружение должно быть готово до импорта приложения в воркерах
+    prepare_multiprocess_metrics(workers)
+    for key, value in per_worker_pool_sizes(workers).items():
+        os.environ.setdefault(key, value)
+
+    import uvicorn
+    uvicorn.run(args.app, host=args.host, port=args.port, workers=workers)
+
+
+if __name__ == "__main__":
+    main()
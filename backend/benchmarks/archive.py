@@ -0,0 +1,135 @@
+"""
+Archive Benchmark
+Время типичных запросов и размер горячей таблицы/индексов до и после архивации
+
+Запуск (из каталога backend, только PostgreSQL):
+    python -m benchmarks.archive --total-rows 10000000 --output bench-archive.json
+
+Строки размножаются на стороне PostgreSQL (generate_series) из небольшой
+засеянной выборки, поэтому 10M строк создаются за минуты.
+"""
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime, timezone
+
+from . import stubs
+from .endpoints import git_commit, percentile, seed
+
+QUERIES = {
+    "list_page": """
+        SELECT * FROM {hot} WHERE owner_id = :owner_id
+        ORDER BY created_at DESC LIMIT 100
+    """,
+    "list_active": """
+        SELECT * FROM {hot} WHERE owner_id = :owner_id AND NOT completed
+        ORDER BY created_at DESC LIMIT 100
+    """,
+    "stats_total": "SELECT count(id) FROM {hot} WHERE owner_id = :owner_id",
+    "stats_by_status": """
+        SELECT status, count(id) FROM {hot} WHERE owner_id = :owner_id GROUP BY status
+    """,
+}
+
+
+def table_sizes(conn, hot: str) -> dict:
+    from sqlalchemy import text
+    row = conn.execute(text("""
+        SELECT pg_relation_size(:t), pg_indexes_size(:t), (SELECT count(*) FROM {hot})
+    """.format(hot=hot)), {"t": hot}).one()
+    return {"table_bytes": row[0], "indexes_bytes": row[1], "rows": row[2]}
+
+
+def time_queries(conn, hot: str, owner_ids, repeats: int) -> dict:
+    from sqlalchemy import text
+    results = {}
+    for name, sql in QUERIES.items():
+        statement = text(sql.format(hot=hot))
+        latencies = []
+        for index in range(repeats):
+            started = time.perf_counter()
+            conn.execute(statement, {"owner_id": owner_ids[index % len(owner_ids)]}).fetchall()
+            latencies.append((time.perf_counter() - started) * 1000)
+        results[name] = {
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "mean_ms": round(statistics.fmean(latencies), 3),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--total-rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--seed-tasks-per-user", type=int, default=100)
+    parser.add_argument("--archive-after-days", type=int, default=90)
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--output", default="bench-archive.json")
+    args = parser.parse_args()
+
+    stubs.install(db="postgres", redis_backend="fake")
+    from sqlalchemy import text
+    from app.core.database import engine, init_db
+    from app.core.archive import HOT_TABLE, archive_once
+
+    init_db()
+    owner_ids = seed(args.users, args.seed_tasks_per_user)
+    seeded = args.users * args.seed_tasks_per_user
+    copies = max(0, args.total_rows // seeded - 1)
+
+    from app.models.models import Task
+    columns = [c.name for c in Task.__table__.columns if c.name != "id"]
+    shifted = {
+        "created_at": "created_at - make_interval(days => n * 7)",
+        "updated_at": "updated_at - make_interval(days => n * 7)",
+        "completed_at": "completed_at - make_interval(days => n * 7)",
+        "due_date": "due_date - make_interval(days => n * 7)",
+    }
+    select_list = ", ".join(shifted.get(name, name) for name in columns)
+
+    print(f"multiplying {seeded} seeded rows x{copies + 1}")
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            INSERT INTO {HOT_TABLE} ({", ".join(columns)})
+            SELECT {select_list}
+            FROM {HOT_TABLE}, generate_series(1, :copies) AS n
+            WHERE owner_id = ANY(:owners)
+        """), {"copies": copies, "owners": owner_ids})
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text(f"VACUUM ANALYZE {HOT_TABLE}"))
+
+    with engine.connect() as conn:
+        before = {"sizes": table_sizes(conn, HOT_TABLE),
+                  "queries": time_queries(conn, HOT_TABLE, owner_ids, args.repeats)}
+    print("before:", json.dumps(before["sizes"]))
+
+    started = time.perf_counter()
+    moved = archive_once(older_than_days=args.archive_after_days)
+    archive_seconds = time.perf_counter() - started
+
+    # VACUUM FULL перестраивает таблицу и индексы, чтобы размер отражал оставшиеся строки
+    with engine.connect() as conn:
+        autocommit = conn.execution_options(isolation_level="AUTOCOMMIT")
+        autocommit.execute(text(f"VACUUM FULL ANALYZE {HOT_TABLE}"))
+        after = {"sizes": table_sizes(conn, HOT_TABLE),
+                 "queries": time_queries(conn, HOT_TABLE, owner_ids, args.repeats)}
+    print("after: ", json.dumps(after["sizes"]))
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "params": vars(args),
+        "archived_rows": moved,
+        "archive_seconds": round(archive_seconds, 2),
+        "before": before,
+        "after": after,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""
+ASGI-приложение для бенчмарков в отдельных процессах (uvicorn --workers)
+
+Каждый воркер импортирует этот модуль заново, поэтому заглушки
+устанавливаются здесь, до импорта app.main.
+"""
+from . import stubs
+
+stubs.install()
+
+from app.main import app  # noqa: E402
+
+stubs.override_auth(app)
@@ -0,0 +1,84 @@
+"""
+Cache Stampede Load Test
+Сколько раз пересчитывается горячий ключ при всплеске одновременных промахов
+
+Запуск (из каталога backend):
+    REDIS_URL=redis://localhost:6379/15 python -m benchmarks.cache_stampede --pods 4 --concurrency 200
+
+Без REDIS_URL используется fakeredis (если установлен).
+Каждый "под" моделируется отдельным экземпляром кэша со своим single-flight,
+все поды разделяют один Redis, как в кластере.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import types
+
+
+def _install_redis_stub():
+    """Подмена app.core.redis_client локальным Redis / fakeredis"""
+    url = os.getenv("REDIS_URL")
+    if url:
+        import redis
+        client = redis.Redis.from_url(url)
+    else:
+        import fakeredis
+        client = fakeredis.FakeRedis()
+
+    module = types.ModuleType("app.core.redis_client")
+    module.redis_client = types.SimpleNamespace(client=client)
+    sys.modules["app.core.redis_client"] = module
+    return client
+
+
+async def run(pods: int, concurrency: int, compute_ms: int, rounds: int) -> dict:
+    client = _install_redis_stub()
+    from app.core.cache import StampedeProtectedCache
+
+    key = "bench:stampede:hot"
+    db_queries = 0
+
+    def compute():
+        nonlocal db_queries
+        db_queries += 1
+        time.sleep(compute_ms / 1000)
+        return [{"id": i, "title": f"task {i}"} for i in range(100)]
+
+    instances = [StampedeProtectedCache(f"bench_pod_{i}") for i in range(pods)]
+    results = []
+    for _ in range(rounds):
+        client.delete(key)
+        db_queries = 0
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            instance.get_or_compute(key, compute, ttl=300)
+            for instance in instances
+            for _ in range(concurrency)
+        ))
+        results.append({
+            "requests": pods * concurrency,
+            "db_queries": db_queries,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        })
+
+    client.delete(key)
+    return {"pods": pods, "concurrency_per_pod": concurrency, "compute_ms": compute_ms, "rounds": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pods", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--compute-ms", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.pods, args.concurrency, args.compute_ms, args.rounds))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Benchmark Comparison
+Сравнение двух JSON-отчётов benchmarks.endpoints
+
+Запуск:
+    python -m benchmarks.compare baseline.json candidate.json --threshold 10
+
+Код возврата 1, если p95 какого-либо эндпоинта вырос больше порога (в процентах).
+"""
+import argparse
+import json
+import sys
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms", "throughput_rps")
+
+
+def change(old: float, new: float) -> float:
+    if not old:
+        return 0.0
+    return (new - old) / old * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0)
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"baseline:  {baseline.get('commit', '?')[:12]}  {baseline.get('timestamp', '')}")
+    print(f"candidate: {candidate.get('commit', '?')[:12]}  {candidate.get('timestamp', '')}")
+    print(f"{'endpoint':12s}" + "".join(f"{metric:>24s}" for metric in METRICS))
+
+    regressions = []
+    for name, new in candidate["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        cells = []
+        for metric in METRICS:
+            delta = change(old[metric], new[metric])
+            cells.append(f"{old[metric]:>9.2f} -> {new[metric]:>8.2f} {delta:+5.0f}%")
+        print(f"{name:12s}" + "".join(f"{cell:>24s}" for cell in cells))
+        if change(old["p95_ms"], new["p95_ms"]) > args.threshold:
+            regressions.append(name)
+
+    if regressions:
+        print(f"p95 regression > {args.threshold}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Compression Benchmark
+Байты на проводе и CPU на запрос для identity/gzip/br/zstd на страницах списка задач:
+сжатие на каждый запрос (как общий gzip-middleware) против сжатого варианта из кэша
+
+Запуск (из каталога backend):
+    python -m benchmarks.compression --db sqlite --rows 100 1000 --iterations 200
+
+br и zstd измеряются, если установлены brotli и zstandard.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import datetime, timezone
+
+from . import stubs
+from .endpoints import git_commit, seed
+
+
+def cpu_per_call(fn, iterations: int) -> dict:
+    """Процессорное время на вызов (мс)"""
+    fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.process_time()
+        fn()
+        samples.append((time.process_time() - started) * 1000)
+    return {
+        "cpu_ms_mean": round(statistics.fmean(samples), 4),
+        "cpu_ms_median": round(statistics.median(samples), 4),
+    }
+
+
+def make_request(accept_encoding: str):
+    from starlette.requests import Request
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/api/tasks",
+        "headers": [(b"accept-encoding", accept_encoding.encode())],
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", choices=["postgres", "sqlite"], default="sqlite")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--output", default="bench-compression.json")
+    args = parser.parse_args()
+
+    stubs.install(db=args.db, redis_backend="fake", reset=True)
+    from sqlalchemy import select
+    from app.core import compression
+    from app.core.database import SessionLocal, init_db
+    from app.core.serialization import TASK_FIELDS, encode_rows
+    from app.models.models import Task
+
+    init_db()
+    owner_id = seed(1, max(args.rows))[0]
+    table = Task.__table__
+    loop = asyncio.new_event_loop()
+    encodings = ["identity"] + [name for name in compression.PREFERENCE if name in compression.ENCODERS]
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "params": vars(args),
+        "encodings": encodings,
+        "pages": {},
+    }
+
+    for rows in args.rows:
+        with SessionLocal() as db:
+            result = db.execute(
+                select(*[table.c[name] for name in TASK_FIELDS])
+                .where(table.c.owner_id == owner_id)
+                .order_by(table.c.created_at.desc()).limit(rows)
+            )
+            body = encode_rows(TASK_FIELDS, result).encode()
+
+        page = {}
+        for encoding in encodings:
+            request = make_request(encoding)
+            cache_key = f"tasks:list:bench:{rows}"
+
+            def cached():
+                return loop.run_until_complete(
+                    compression.compressed_response(request, body, cache_key=cache_key, ttl=300)
+                )
+
+            if encoding == "identity":
+                wire = len(body)
+                per_request = cpu_per_call(lambda: body, args.iterations)
+                cached_path = cpu_per_call(cached, args.iterations)
+            else:
+                wire = len(compression.compress(body, encoding))
+                per_request = cpu_per_call(lambda: compression.compress(body, encoding), args.iterations)
+                cached_path = cpu_per_call(cached, args.iterations)
+
+            page[encoding] = {
+                "bytes_on_wire": wire,
+                "ratio": round(len(body) / wire, 2),
+                "compress_every_request": per_request,
+                "cached_variant": cached_path,
+            }
+            print(f"rows={rows:5d} {encoding:8s} bytes={wire:9d} ratio={len(body) / wire:6.2f} "
+                  f"compress={per_request['cpu_ms_mean']:8.3f}ms cached={cached_path['cpu_ms_mean']:8.3f}ms")
+        report["pages"][str(rows)] = {"uncompressed_bytes": len(body), "encodings": page}
+
+    loop.close()
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+Endpoint Benchmark
+Латентность (p50/p95/p99) и пропускная способность эндпоинтов задач
+
+Запуск (из каталога backend):
+    # PostgreSQL в контейнере
+    docker run -d --rm --name bench-pg -p 5432:5432 \\
+        -e POSTGRES_USER=taskuser -e POSTGRES_PASSWORD=bench -e POSTGRES_DB=taskdb_bench postgres:15
+    python -m benchmarks.endpoints --output bench-results/$(git rev-parse --short HEAD).json
+
+    # Без контейнеров (эндпоинты, которым нужен PostgreSQL, пропускаются)
+    python -m benchmarks.endpoints --db sqlite --requests 200
+
+Результаты сравниваются через benchmarks.compare.
+"""
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import statistics
+import subprocess
+import time
+from contextlib import AsyncExitStack
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from . import stubs
+
+# Сценарии, которые на SQLite не выполняются: имя -> причина
+POSTGRES_ONLY = {
+    "stats": "task_tag_counts (trigger) and unnest() over the archive require PostgreSQL",
+}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = math.ceil(pct / 100 * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int) -> Dict[str, float]:
+    ms = [value * 1000 for value in latencies]
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(ms), 3) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def seed(users: int, tasks_per_user: int) -> List[int]:
+    """Создание пользователей и задач; возвращает id пользователей"""
+    from sqlalchemy import insert
+    from app.core.database import engine
+    from app.models.models import User, Task, PriorityEnum, StatusEnum
+
+    rng = random.Random(42)
+    run_id = int(time.time())
+    now = datetime.now(timezone.utc)
+    priorities = list(PriorityEnum)
+    statuses = list(StatusEnum)
+    user_ids = []
+
+    with engine.begin() as conn:
+        for index in range(users):
+            result = conn.execute(insert(User).values(
+                username=f"bench_{run_id}_{index}",
+                email=f"bench_{run_id}_{index}@example.com",
+                full_name=f"Bench User {index}",
+                hashed_password="!",
+                is_active=True,
+                is_admin=False,
+            ))
+            user_id = result.inserted_primary_key[0]
+            user_ids.append(user_id)
+
+            rows = []
+            for number in range(tasks_per_user):
+                created_at = now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+                completed = rng.random() < 0.4
+                rows.append({
+                    "title": f"Task {number} for user {index}",
+                    "description": "Lorem ipsum dolor sit amet " * rng.randint(1, 8),
+                    "priority": rng.choice(priorities),
+                    "status": rng.choice(statuses),
+                    "completed": completed,
+                    "completed_at": created_at + timedelta(days=1) if completed else None,
+                    "due_date": created_at + timedelta(days=rng.randint(1, 30)),
+                    "created_at": created_at,
+                    "updated_at": created_at,
+                    "owner_id": user_id,
+                })
+            for start in range(0, len(rows), 1000):
+                conn.execute(insert(Task), rows[start:start + 1000])
+
+    return user_ids
+
+
+async def measure(name: str, total: int, concurrency: int,
+                  request: Callable[[int], Awaitable[int]],
+                  prepare: Optional[Callable[[int], Awaitable[None]]] = None) -> Dict[str, float]:
+    """
+    Выполнить total запросов с заданной конкурентностью
+
+    prepare(index) выполняется перед каждым запросом вне замера (сброс кэша,
+    создание удаляемой задачи); его время вычитается и из времени прогона.
+    Ответы с ошибкой считаются в errors и не попадают в перцентили.
+    """
+    latencies: List[float] = []
+    errors = 0
+    prepare_time = 0.0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors, prepare_time
+        for index in counter:
+            if prepare is not None:
+                prepared = time.perf_counter()
+                await prepare(index)
+                prepare_time += time.perf_counter() - prepared
+            started = time.perf_counter()
+            status_code = await request(index)
+            elapsed = time.perf_counter() - started
+            if status_code >= 400:
+                errors += 1
+            else:
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started - prepare_time / concurrency
+    result = summarize(latencies, elapsed, errors)
+    print(f"{name:12s} p50={result['p50_ms']:8.2f}ms p95={result['p95_ms']:8.2f}ms "
+          f"p99={result['p99_ms']:8.2f}ms rps={result['throughput_rps']:8.1f} errors={errors}")
+    return result
+
+
+async def run(args) -> dict:
+    import httpx
+    from app.main import app
+    from app.core.database import init_db
+    from app.core.redis_client import redis_client
+
+    async with AsyncExitStack() as stack:
+        if args.db == "postgres":
+            # ASGITransport не выполняет lifespan: схема, расширения PostgreSQL
+            # и фильтр отозванных токенов поднимаются так же, как при старте пода
+            await stack.enter_async_context(app.router.lifespan_context(app))
+        else:
+            # Lifespan на SQLite не пройдёт (DDL PostgreSQL): только таблицы моделей
+            init_db()
+        user_ids = seed(args.users, args.tasks_per_user)
+        stubs.override_auth(app)
+
+        rng = random.Random(7)
+        task_ids: Dict[int, List[int]] = {}
+        # Задача для каждого замера удаления: index -> (пользователь, задача)
+        to_delete: Dict[int, Tuple[int, int]] = {}
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            def headers(user_id: int) -> Dict[str, str]:
+                return {"X-Bench-User": str(user_id)}
+
+            for user_id in user_ids:
+                response = await client.get("/api/tasks", params={"limit": 1000}, headers=headers(user_id))
+                task_ids[user_id] = [task["id"] for task in response.json()]
+
+            def pick_user(index: int) -> int:
+                return user_ids[index % len(user_ids)]
+
+            async def flush_lists(index):
+                redis_client.flush_pattern("tasks:list:*")
+
+            async def list_cold(index):
+                response = await client.get("/api/tasks", params={"limit": args.page_size},
+                                            headers=headers(pick_user(index)))
+                return response.status_code
+
+            async def list_warm(index):
+                response = await client.get("/api/tasks", params={"limit": args.page_size},
+                                            headers=headers(pick_user(index)))
+                return response.status_code
+
+            async def get_one(index):
+                user_id = pick_user(index)
+                task_id = rng.choice(task_ids[user_id])
+                response = await client.get(f"/api/tasks/{task_id}", headers=headers(user_id))
+                return response.status_code
+
+            async def create(index):
+                user_id = pick_user(index)
+                response = await client.post("/api/tasks", headers=headers(user_id), json={
+                    "title": f"Bench task {index}",
+                    "description": "created by benchmark",
+                })
+                return response.status_code
+
+            async def update(index):
+                user_id = pick_user(index)
+                task_id = rng.choice(task_ids[user_id])
+                response = await client.put(f"/api/tasks/{task_id}", headers=headers(user_id),
+                                            json={"title": f"Updated {index}"})
+                return response.status_code
+
+            async def create_victim(index):
+                user_id = pick_user(index)
+                response = await client.post("/api/tasks", headers=headers(user_id), json={
+                    "title": f"Bench task to delete {index}",
+                })
+                response.raise_for_status()
+                to_delete[index] = (user_id, response.json()["id"])
+
+            async def delete(index):
+                user_id, task_id = to_delete.pop(index)
+                response = await client.delete(f"/api/tasks/{task_id}", headers=headers(user_id))
+                return response.status_code
+
+            async def stats(index):
+                response = await client.get("/api/stats", headers=headers(pick_user(index)))
+                return response.status_code
+
+            # (имя, запрос, подготовка вне замера)
+            scenarios = [
+                ("list_cold", list_cold, flush_lists),
+                ("list_warm", list_warm, None),
+                ("get", get_one, None),
+                ("create", create, None),
+                ("update", update, None),
+                ("delete", delete, create_victim),
+                ("stats", stats, None),
+            ]
+
+            results = {}
+            skipped = {}
+            for name, request, prepare in scenarios:
+                if args.db == "sqlite" and name in POSTGRES_ONLY:
+                    skipped[name] = POSTGRES_ONLY[name]
+                    print(f"{name:12s} skipped: {POSTGRES_ONLY[name]}")
+                    continue
+                # Прогрев
+                await measure(f"{name} (warmup)", min(args.warmup, args.requests), 1, request, prepare)
+                results[name] = await measure(name, args.requests, args.concurrency, request, prepare)
+
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "params": {
+            "db": args.db,
+            "redis": args.redis,
+            "users": args.users,
+            "tasks_per_user": args.tasks_per_user,
+            "page_size": args.page_size,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "results": results,
+        "skipped": skipped,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", choices=["postgres", "sqlite"], default="postgres")
+    parser.add_argument("--redis", choices=["fake", "local"], default="fake")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--tasks-per-user", type=int, default=2000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--output", default="bench-results.json")
+    args = parser.parse_args()
+
+    stubs.install(db=args.db, redis_backend=args.redis, reset=True)
+    report = asyncio.run(run(args))
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Serialization Benchmark
+CPU на страницу из 1000 задач: прежний путь (ORM + Pydantic дважды)
+против выборки колонок кортежами и прямого кодирования в JSON
+
+Запуск (из каталога backend):
+    python -m benchmarks.serialization --db sqlite --rows 1000 --iterations 200
+"""
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime, timezone
+from typing import List
+
+from . import stubs
+from .endpoints import git_commit, seed
+
+
+def measure(fn, iterations: int) -> dict:
+    """Процессорное время на вызов (мс)"""
+    fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.process_time()
+        fn()
+        samples.append((time.process_time() - started) * 1000)
+    return {
+        "cpu_ms_mean": round(statistics.fmean(samples), 3),
+        "cpu_ms_median": round(statistics.median(samples), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", choices=["postgres", "sqlite"], default="sqlite")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--output", default="bench-serialization.json")
+    args = parser.parse_args()
+
+    stubs.install(db=args.db, redis_backend="fake", reset=True)
+    from pydantic import TypeAdapter
+    from sqlalchemy import select
+    from app.core.database import SessionLocal, init_db
+    from app.core.serialization import TASK_FIELDS, encode_rows, parse_fields
+    from app.models.models import Task
+    from app.schemas import schemas
+
+    init_db()
+    owner_id = seed(1, args.rows)[0]
+    response_adapter = TypeAdapter(List[schemas.TaskResponse])
+    table = Task.__table__
+
+    def orm_path():
+        # Прежний путь: ORM-объекты, model_validate/model_dump для кэша,
+        # затем повторная валидация и сериализация FastAPI по response_model
+        with SessionLocal() as db:
+            tasks = db.query(Task).filter(Task.owner_id == owner_id) \
+                .order_by(Task.created_at.desc()).limit(args.rows).all()
+            cached = [schemas.TaskResponse.model_validate(task).model_dump() for task in tasks]
+            response_adapter.dump_json(response_adapter.validate_python(tasks))
+            return cached
+
+    def projected(fields: List[str]):
+        def run():
+            with SessionLocal() as db:
+                rows = db.execute(
+                    select(*[table.c[name] for name in fields])
+                    .where(table.c.owner_id == owner_id)
+                    .order_by(table.c.created_at.desc())
+                    .limit(args.rows)
+                )
+                return encode_rows(fields, rows)
+        return run
+
+    sparse = parse_fields("id,title,status")
+    results = {
+        "orm_pydantic": measure(orm_path, args.iterations),
+        "projected_all_fields": measure(projected(TASK_FIELDS), args.iterations),
+        "projected_id_title_status": measure(projected(sparse), args.iterations),
+    }
+    results["bytes"] = {
+        "all_fields": len(projected(TASK_FIELDS)()),
+        "id_title_status": len(projected(sparse)()),
+    }
+    for name, result in results.items():
+        print(f"{name:28s} {result}")
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "params": vars(args),
+            "results": results,
+        }, f, indent=2)
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Benchmark Stand-ins
+Подмена внешних зависимостей для запуска app без кластера:
+Vault и Keycloak заглушками, Redis — fakeredis или локальным Redis,
+PostgreSQL — контейнером (по умолчанию) или SQLite
+
+Должен вызываться до импорта app.main.
+"""
+import os
+import sys
+import types
+from typing import Optional
+
+
+class StubVaultClient:
+    """Vault без сервера: конфигурация из переменных окружения бенчмарка"""
+
+    def __init__(self):
+        self.client = None
+
+    def get_secret(self, path: str, key: Optional[str] = None):
+        raise KeyError(path)
+
+    def get_database_config(self):
+        return {
+            'host': os.getenv('BENCH_DB_HOST', 'localhost'),
+            'port': os.getenv('BENCH_DB_PORT', '5432'),
+            'database': os.getenv('BENCH_DB_NAME', 'taskdb_bench'),
+            'user': os.getenv('BENCH_DB_USER', 'taskuser'),
+            'password': os.getenv('BENCH_DB_PASSWORD', 'bench'),
+        }
+
+    def get_redis_config(self):
+        return {
+            'host': os.getenv('BENCH_REDIS_HOST', 'localhost'),
+            'port': os.getenv('BENCH_REDIS_PORT', '6379'),
+            'password': None,
+            'db': os.getenv('BENCH_REDIS_DB', '15'),
+        }
+
+    def get_app_config(self):
+        return {
+            'secret_key': 'bench-secret-key',
+            'algorithm': 'HS256',
+            'access_token_expire_minutes': 30,
+            'admin_username': 'admin',
+            'admin_password': 'admin',
+            'api_title': 'Task Manager API (bench)',
+            'api_version': 'bench',
+            'cors_origins': ['*'],
+            'debug': False,
+        }
+
+    def get_monitoring_config(self):
+        return {'enabled': True, 'prometheus_port': 9090, 'log_level': 'WARNING'}
+
+    def refresh_secrets(self):
+        pass
+
+
+def _install_vault():
+    module = types.ModuleType("app.core.vault")
+    module.VaultClient = StubVaultClient
+    module.vault_client = StubVaultClient()
+    sys.modules["app.core.vault"] = module
+
+
+def _install_keycloak():
+    module = types.ModuleType("app.core.keycloak")
+    module.keycloak_client = None
+
+    def init_keycloak_from_vault(vault_client):
+        raise RuntimeError("Keycloak disabled in benchmarks")
+
+    module.init_keycloak_from_vault = init_keycloak_from_vault
+    sys.modules["app.core.keycloak"] = module
+
+
+def _install_fakeredis():
+    import fakeredis
+    import redis
+
+    server = fakeredis.FakeServer()
+
+    class BenchRedis(fakeredis.FakeRedis):
+        def __init__(self, *args, **kwargs):
+            kwargs.pop("connection_pool", None)
+            kwargs["server"] = server
+            super().__init__(*args, **kwargs)
+
+    redis.Redis = BenchRedis
+    redis.StrictRedis = BenchRedis
+
+
+def _install_sqlite(path: str):
+    """SQLite вместо PostgreSQL (без специфичных для PostgreSQL возможностей)"""
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import declarative_base, sessionmaker
+
+    module = types.ModuleType("app.core.database")
+    module.engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    module.SessionLocal = sessionmaker(bind=module.engine, autoflush=False)
+    module.Base = declarative_base()
+
+    def get_db():
+        db = module.SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def init_db():
+        import app.models.models  # noqa: F401 - регистрация моделей
+        module.Base.metadata.create_all(bind=module.engine)
+
+    def check_db_connection():
+        with module.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return True
+
+    module.get_db = get_db
+    module.init_db = init_db
+    module.check_db_connection = check_db_connection
+    sys.modules["app.core.database"] = module
+
+
+def install(db: Optional[str] = None, redis_backend: Optional[str] = None,
+            sqlite_path: Optional[str] = None, reset: bool = False):
+    """
+    Установка заглушек
+
+    Параметры по умолчанию берутся из окружения (BENCH_DB, BENCH_REDIS, BENCH_SQLITE_PATH)
+    и записываются обратно, чтобы воркеры uvicorn получили ту же конфигурацию.
+
+    Args:
+        db: 'postgres' (BENCH_DB_* переменные) или 'sqlite'
+        redis_backend: 'fake' (fakeredis) или 'local' (BENCH_REDIS_* переменные)
+        sqlite_path: файл базы для режима sqlite
+        reset: удалить файл SQLite перед запуском
+    """
+    db = os.environ.setdefault("BENCH_DB", db or "postgres")
+    redis_backend = os.environ.setdefault("BENCH_REDIS", redis_backend or "fake")
+    sqlite_path = os.environ.setdefault("BENCH_SQLITE_PATH", sqlite_path or "/tmp/bench.sqlite3")
+
+    # Бенчмарк измеряет приложение, а не защиту от перегрузки
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    os.environ.setdefault("LOAD_SHED_MAX_ACTIVE_REQUESTS", "1000000")
+    os.environ.setdefault("LOAD_SHED_MAX_POOL_UTILIZATION", "2")
+    os.environ.setdefault("TRACING_ENABLED", "false")
+    # Фоновые задачи lifespan не должны менять данные во время замеров
+    # (архиватор перенёс бы засеянные задачи старше 90 дней)
+    os.environ.setdefault("ARCHIVE_ENABLED", "false")
+    os.environ.setdefault("ANALYTICS_ENABLED", "false")
+
+    _install_vault()
+    _install_keycloak()
+    if redis_backend == "fake":
+        _install_fakeredis()
+    if db == "sqlite":
+        if reset and os.path.exists(sqlite_path):
+            os.remove(sqlite_path)
+        _install_sqlite(sqlite_path)
+
+
+def override_auth(app):
+    """Аутентификация без Keycloak/JWT: пользователь по заголовку X-Bench-User"""
+    from fastapi import Request
+    from app.core.database import SessionLocal
+    from app.core.security import get_current_user
+    from app.models.models import User
+
+    users = {}
+
+    def bench_current_user(request: Request):
+        user_id = int(request.headers["x-bench-user"])
+        if user_id not in users:
+            with SessionLocal() as session:
+                user = session.get(User, user_id)
+                session.expunge(user)
+            users[user_id] = user
+        return users[user_id]
+
+    app.dependency_overrides[get_current_user] = bench_current_user
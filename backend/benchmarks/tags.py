@@ -0,0 +1,164 @@
+"""
+Tags Benchmark
+Латентность фильтра по тегам (GIN-индекс и без него) и статистики по тегам
+для пользователя со 100k задач и тысячами тегов
+
+Запуск (из каталога backend, только PostgreSQL):
+    python -m benchmarks.tags --tasks 100000 --tags 2000 --output bench-tags.json
+
+Популярность тегов неравномерная (tag-0 самый частый), у задачи 1-5 тегов.
+"""
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime, timezone
+
+from . import stubs
+from .endpoints import git_commit, percentile, seed
+
+FILTERS = {
+    "any_popular": ("any", ["tag-0"]),
+    "any_rare": ("any", ["tag-1500"]),
+    "any_three": ("any", ["tag-10", "tag-200", "tag-1000"]),
+    "all_two_popular": ("all", ["tag-0", "tag-1"]),
+    "all_two_rare": ("all", ["tag-3", "tag-900"]),
+}
+
+
+def timed(conn, statement, params: dict, repeats: int) -> dict:
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        conn.execute(statement, params).fetchall()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+    }
+
+
+def filter_statement(hot: str, match: str):
+    from sqlalchemy import text
+    operator = "@>" if match == "all" else "&&"
+    return text(f"""
+        SELECT id, title, status, priority, tags, created_at FROM {hot}
+        WHERE owner_id = :owner_id AND tags {operator} CAST(:tags AS TEXT[])
+        ORDER BY created_at DESC LIMIT 100
+    """)
+
+
+def time_filters(conn, hot: str, owner_id: int, repeats: int) -> dict:
+    from sqlalchemy import text
+    results = {}
+    for name, (match, tags) in FILTERS.items():
+        params = {"owner_id": owner_id, "tags": tags}
+        statement = filter_statement(hot, match)
+        plan = "\n".join(conn.execute(text(f"EXPLAIN {statement.text}"), params).scalars())
+        results[name] = {
+            **timed(conn, statement, params, repeats),
+            "matches": conn.execute(
+                text(f"SELECT count(*) FROM ({statement.text.replace('LIMIT 100', '')}) AS m"), params
+            ).scalar(),
+            "uses_gin": f"ix_{hot}_tags" in plan,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=100_000)
+    parser.add_argument("--tags", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=100)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--output", default="bench-tags.json")
+    args = parser.parse_args()
+
+    stubs.install(db="postgres", redis_backend="fake")
+    from sqlalchemy import text
+    from app.core.database import engine, init_db
+    from app.core.schema import TAG_COUNTS_TABLE, apply_schema_extensions
+    from app.models.models import Task
+
+    hot = Task.__tablename__
+    init_db()
+    apply_schema_extensions()
+    owner_id = seed(1, args.tasks)[0]
+
+    # Теги назначаются на стороне PostgreSQL; счётчики заполняет триггер
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            UPDATE {hot} SET tags = ARRAY(
+                SELECT DISTINCT 'tag-' || floor(power(random(), 3) * :tags)::int
+                FROM generate_series(1, 1 + {hot}.id % 5)
+            )
+            WHERE owner_id = :owner_id
+        """), {"tags": args.tags, "owner_id": owner_id})
+    tagging_seconds = time.perf_counter() - started
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text(f"VACUUM ANALYZE {hot}"))
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "params": vars(args),
+        "tagging_seconds": round(tagging_seconds, 2),
+    }
+
+    with engine.connect() as conn:
+        report["distinct_tags"] = conn.execute(
+            text(f"SELECT count(*) FROM {TAG_COUNTS_TABLE} WHERE owner_id = :owner_id"), {"owner_id": owner_id}
+        ).scalar()
+        report["filter_gin"] = time_filters(conn, hot, owner_id, args.repeats)
+
+        # Без GIN-индекса: индекс удаляется внутри транзакции и возвращается откатом
+        conn.commit()
+        with conn.begin() as transaction:
+            conn.execute(text(f"DROP INDEX ix_{hot}_tags"))
+            report["filter_no_index"] = time_filters(conn, hot, owner_id, args.repeats)
+            transaction.rollback()
+
+        report["stats_by_tag"] = {
+            "counts_table": timed(conn, text(f"""
+                SELECT tag, count FROM {TAG_COUNTS_TABLE}
+                WHERE owner_id = :owner_id AND count > 0 ORDER BY count DESC, tag
+            """), {"owner_id": owner_id}, args.repeats),
+            "unnest_group_by": timed(conn, text(f"""
+                SELECT tag, count(*) FROM {hot}, unnest(tags) AS tag
+                WHERE owner_id = :owner_id GROUP BY tag ORDER BY count(*) DESC, tag
+            """), {"owner_id": owner_id}, max(1, args.repeats // 10)),
+        }
+
+        # Цена триггера на запись: изменение тегов одной задачи
+        ids = conn.execute(
+            text(f"SELECT id FROM {hot} WHERE owner_id = :owner_id LIMIT :n"),
+            {"owner_id": owner_id, "n": args.updates}
+        ).scalars().all()
+        conn.commit()
+        latencies = []
+        for index, task_id in enumerate(ids):
+            started = time.perf_counter()
+            with conn.begin():
+                conn.execute(text(f"UPDATE {hot} SET tags = CAST(:tags AS TEXT[]) WHERE id = :id"),
+                             {"id": task_id, "tags": [f"tag-{index % args.tags}", "tag-0"]})
+            latencies.append((time.perf_counter() - started) * 1000)
+        report["tag_update"] = {
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+        }
+
+    for section in ("filter_gin", "filter_no_index"):
+        for name, result in report[section].items():
+            print(f"{section:16s} {name:16s} p50={result['p50_ms']:8.2f}ms p95={result['p95_ms']:8.2f}ms "
+                  f"matches={result['matches']} gin={result['uses_gin']}")
+    print("stats_by_tag", json.dumps(report["stats_by_tag"]))
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
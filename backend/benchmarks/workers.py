@@ -0,0 +1,112 @@
+"""
+Worker Scaling Benchmark
+Пропускная способность при 1..N воркерах uvicorn (через app.server)
+
+Запуск (из каталога backend, PostgreSQL и Redis как в benchmarks.endpoints):
+    python -m benchmarks.workers --max-workers 4 --redis local --output bench-workers.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from . import stubs
+from .endpoints import git_commit, measure, seed
+
+
+def wait_ready(url: str, timeout: float = 60.0):
+    import httpx
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"server at {url} did not become ready")
+
+
+async def load(url: str, user_ids, requests: int, concurrency: int, page_size: int) -> dict:
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        async def list_tasks(index):
+            user_id = user_ids[index % len(user_ids)]
+            response = await client.get("/api/tasks", params={"limit": page_size},
+                                        headers={"X-Bench-User": str(user_id)})
+            return response.status_code
+
+        async def stats(index):
+            user_id = user_ids[index % len(user_ids)]
+            response = await client.get("/api/stats", headers={"X-Bench-User": str(user_id)})
+            return response.status_code
+
+        await measure("warmup", min(200, requests), concurrency, list_tasks)
+        return {
+            "list_warm": await measure("list_warm", requests, concurrency, list_tasks),
+            "stats": await measure("stats", requests, concurrency, stats),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", choices=["postgres", "sqlite"], default="postgres")
+    parser.add_argument("--redis", choices=["fake", "local"], default="local")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--tasks-per-user", type=int, default=2000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", default="bench-workers.json")
+    args = parser.parse_args()
+
+    stubs.install(db=args.db, redis_backend=args.redis, reset=True)
+    from app.core.database import init_db
+    init_db()
+    user_ids = seed(args.users, args.tasks_per_user)
+
+    url = f"http://127.0.0.1:{args.port}"
+    results = {}
+    for workers in range(1, args.max_workers + 1):
+        print(f"--- workers={workers}")
+        server = subprocess.Popen([
+            sys.executable, "-m", "app.server",
+            "--app", "benchmarks.bench_app:app",
+            "--host", "127.0.0.1", "--port", str(args.port),
+            "--workers", str(workers),
+        ], env=os.environ.copy())
+        try:
+            wait_ready(url)
+            results[str(workers)] = asyncio.run(
+                load(url, user_ids, args.requests, args.concurrency, args.page_size)
+            )
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    baseline = results["1"]["list_warm"]["throughput_rps"] or 1
+    for workers, result in results.items():
+        result["speedup"] = round(result["list_warm"]["throughput_rps"] / baseline, 2)
+        print(f"workers={workers:>2} list_warm rps={result['list_warm']['throughput_rps']:8.1f} "
+              f"speedup={result['speedup']}x")
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "params": vars(args),
+            "results": results,
+        }, f, indent=2)
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Shard Rebalance Tests
+Откат move_user: каталог возвращается на старый шард, новый шард очищается
+"""
+from contextlib import nullcontext
+from unittest import mock
+
+import pytest
+
+from app.core import shard_rebalance
+from app.core.sharding import DIRECTORY_KEY, MOVING_PREFIX
+
+OWNER_ID = 42
+SOURCE, TARGET = 0, 1
+
+
+@pytest.fixture
+def rebalance(monkeypatch):
+    source_engine, target_engine = object(), object()
+    router = mock.Mock()
+    router.resolve.return_value = (SOURCE, False)
+    router.engine_for_shard.side_effect = {SOURCE: source_engine, TARGET: target_engine}.__getitem__
+    redis = mock.Mock()
+
+    monkeypatch.setattr(shard_rebalance, "shard_router", router)
+    monkeypatch.setattr(shard_rebalance, "redis_client", mock.Mock(client=redis))
+    monkeypatch.setattr(shard_rebalance, "_archiving_paused", lambda *engines: nullcontext())
+    monkeypatch.setattr(shard_rebalance, "_copy_tasks", mock.Mock(return_value=3))
+    monkeypatch.setattr(shard_rebalance, "_remove_deleted", mock.Mock(return_value=0))
+    monkeypatch.setattr(shard_rebalance, "_move_archive", mock.Mock(return_value=2))
+    monkeypatch.setattr(shard_rebalance, "_fingerprint", mock.Mock(return_value=(3, "digest", 2)))
+    delete_user_tasks = mock.Mock(return_value=5)
+    monkeypatch.setattr(shard_rebalance, "_delete_user_tasks", delete_user_tasks)
+
+    return mock.Mock(redis=redis, delete_user_tasks=delete_user_tasks,
+                     source=source_engine, target=target_engine)
+
+
+def directory_writes(redis):
+    return [call.args for call in redis.hset.call_args_list]
+
+
+def test_fingerprint_mismatch_rolls_back_and_purges_target(rebalance):
+    shard_rebalance._fingerprint.side_effect = [(3, "digest", 2), (3, "other", 2)]
+
+    with pytest.raises(RuntimeError, match="mismatch"):
+        shard_rebalance.move_user(OWNER_ID, TARGET, settle_seconds=0)
+
+    assert directory_writes(rebalance.redis) == [
+        (DIRECTORY_KEY, OWNER_ID, f"{MOVING_PREFIX}{SOURCE}:{TARGET}"),
+        (DIRECTORY_KEY, OWNER_ID, SOURCE),
+    ]
+    rebalance.delete_user_tasks.assert_called_once_with(rebalance.target, OWNER_ID, 1000)
+
+
+def test_copy_failure_before_freeze_purges_target(rebalance):
+    shard_rebalance._copy_tasks.side_effect = OSError("connection reset")
+
+    with pytest.raises(OSError):
+        shard_rebalance.move_user(OWNER_ID, TARGET, settle_seconds=0)
+
+    assert directory_writes(rebalance.redis) == [(DIRECTORY_KEY, OWNER_ID, SOURCE)]
+    rebalance.delete_user_tasks.assert_called_once_with(rebalance.target, OWNER_ID, 1000)
+
+
+def test_purge_failure_keeps_original_error(rebalance):
+    shard_rebalance._move_archive.side_effect = ValueError("archive")
+    rebalance.delete_user_tasks.side_effect = OSError("target down")
+
+    with pytest.raises(ValueError, match="archive"):
+        shard_rebalance.move_user(OWNER_ID, TARGET, settle_seconds=0)
+
+    assert directory_writes(rebalance.redis)[-1] == (DIRECTORY_KEY, OWNER_ID, SOURCE)
+
+
+def test_successful_move_deletes_only_source(rebalance):
+    result = shard_rebalance.move_user(OWNER_ID, TARGET, settle_seconds=0)
+
+    assert result["moved"] is True
+    assert directory_writes(rebalance.redis)[-1] == (DIRECTORY_KEY, OWNER_ID, TARGET)
+    rebalance.delete_user_tasks.assert_called_once_with(rebalance.source, OWNER_ID, 1000)